@@ -0,0 +1,140 @@
+import asyncio
+
+import structlog
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from . import profiler, dependencies
+from .config import settings
+
+logger = structlog.get_logger(__name__)
+
+STATS_PREFIX = "/stats/"
+
+# Stats paths whose response depends on who asks, not only on their role
+# and site; requests to these coalesce only with the same caller's.
+PER_CALLER = set()
+
+class Limiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.semaphore = asyncio.Semaphore(limit)
+
+    def statistics(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+class Overloaded(Exception):
+    pass
+
+# Runs in the event loop, in front of the threadpool: identical stats
+# requests share one computation, and queued requests wait here without
+# holding a worker thread or a database connection, so point awards and
+# check-ins always find both free.
+class AdmissionGate:
+    def __init__(self):
+        self._routes = {}
+        self._total = None
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def _limiters(self, path: str) -> list:
+        if path not in self._routes:
+            self._routes[path] = Limiter(settings.STATS_ROUTE_LIMITS.get(path, settings.STATS_ROUTE_CONCURRENCY))
+        if self._total is None:
+            self._total = Limiter(settings.STATS_TOTAL_CONCURRENCY)
+        return [self._routes[path], self._total]
+
+    async def _acquire(self, limiter: Limiter, deadline: float):
+        loop = asyncio.get_running_loop()
+        if limiter.semaphore.locked() and limiter.waiting >= settings.STATS_QUEUE_SIZE:
+            limiter.rejected += 1
+            raise Overloaded()
+        limiter.waiting += 1
+        try:
+            await asyncio.wait_for(limiter.semaphore.acquire(), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            limiter.rejected += 1
+            raise Overloaded()
+        finally:
+            limiter.waiting -= 1
+        limiter.active += 1
+
+    def _release(self, limiter: Limiter):
+        limiter.active -= 1
+        limiter.semaphore.release()
+
+    async def _run(self, request: Request, call_next) -> tuple:
+        deadline = asyncio.get_running_loop().time() + settings.STATS_QUEUE_TIMEOUT
+        acquired = []
+        try:
+            for limiter in self._limiters(request.url.path):
+                await self._acquire(limiter, deadline)
+                acquired.append(limiter)
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            return response.status_code, response.raw_headers, body
+        except Overloaded:
+            logger.warning("stats request rejected", path=request.url.path)
+            rejected = JSONResponse(
+                {"detail": "Statistics are busy, retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(settings.STATS_RETRY_AFTER)},
+            )
+            return rejected.status_code, rejected.raw_headers, rejected.body
+        finally:
+            for limiter in acquired:
+                self._release(limiter)
+
+    async def handle(self, request: Request, call_next):
+        if request.method != "GET" or not request.url.path.startswith(STATS_PREFIX):
+            return await call_next(request)
+
+        # Routes authorise on role, so a viewer never shares an admin's
+        # response; phones and projectors with the same role still do.
+        claims = dependencies.token_claims(request)
+        caller = claims.get("sub") if request.url.path in PER_CALLER else None
+        key = (claims.get("role"), caller, dependencies.request_site(request),
+               request.url.path, tuple(sorted(request.query_params.multi_items())))
+        # A profile must measure its own computation, so it neither joins
+        # nor leads a shared flight.
+        profiled = profiler.requested(request)
+        flight = None if profiled else self._in_flight.get(key)
+        coalesced = flight is not None
+        if profiled:
+            status_code, headers, body = await self._run(request, call_next)
+        elif coalesced:
+            self.coalesced += 1
+            status_code, headers, body = await asyncio.shield(flight)
+        else:
+            # The computation is its own task, so a leader whose client goes
+            # away stops waiting without cancelling it under its followers.
+            flight = asyncio.ensure_future(self._run(request, call_next))
+            self._in_flight[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+            status_code, headers, body = await asyncio.shield(flight)
+
+        response = Response(content=body, status_code=status_code)
+        response.raw_headers = list(headers)
+        if coalesced:
+            response.headers["X-Coalesced"] = "true"
+        return response
+
+    def _land(self, key, flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not flight.cancelled():
+            # Retrieve it so a flight nobody is left to await does not warn.
+            flight.exception()
+
+    def statistics(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "total": self._total.statistics() if self._total else None,
+            "routes": {path: limiter.statistics() for path, limiter in self._routes.items()},
+        }
+
+gate = AdmissionGate()
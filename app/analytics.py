@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import String, cast
+from sqlalchemy.orm import Session
+
+from . import models, events
+from .config import settings
+
+PRESENCE_BIT = models.CATEGORY_BITS["presence"]
+
+LOW_ATTENDANCE_WINDOW = 7
+LOW_ATTENDANCE_DAYS = 2
+LOW_ENGAGEMENT_SCORE = 40.0
+DROP_AFTER_MISSED_DAYS = 2
+AT_RISK_LIMIT = 50
+
+# Dense student x event-day view of one event: row i is students[i], column j
+# is start_date + j days. Every metric below is a whole-matrix NumPy operation.
+class AttendanceMatrix:
+    def __init__(self, student_ids, names, groups, start_date, attendance, points):
+        self.student_ids = student_ids
+        self.names = names
+        self.groups = groups
+        self.start_date = start_date
+        self.attendance = attendance
+        self.points = points
+
+    @property
+    def days(self) -> int:
+        return self.attendance.shape[1]
+
+def build_matrix(db: Session, event_id: int = None) -> AttendanceMatrix:
+    event = events.get_event(db, event_id)
+    start_date, _ = events.event_dates(event)
+    days = events.days_elapsed(event)
+
+    # Plain Core rows: the ORM's per-row bookkeeping costs more than the fetch here.
+    students = db.execute(events.scope_students(db.query(models.Student.id, models.Student.name, models.Student.group), event_id).statement).all()
+    student_ids = np.array([s.id for s in students], dtype=str)
+    order = np.argsort(student_ids)
+    student_ids = student_ids[order]
+    names = np.array([s.name or "" for s in students], dtype=str)[order]
+    groups = np.array([s.group or "" for s in students], dtype=str)[order]
+
+    attendance = np.zeros((len(student_ids), days), dtype=bool)
+    points = np.zeros((len(student_ids), days), dtype=np.int32)
+    # Dates come back as ISO text so NumPy parses the whole column at once
+    # instead of building a date object per row.
+    rows = db.execute(events.scope_points(
+        db.query(models.Points.student_id, cast(models.Points.award_date, String), models.Points.categories, models.Points.total), event_id
+    ).filter(models.Points.award_date.between(start_date, start_date + timedelta(days=days - 1))).statement).all()
+
+    if rows and len(student_ids) and days:
+        row_students, row_days, row_categories, row_totals = zip(*rows)
+        row_students = np.array(row_students, dtype=str)
+        index = np.minimum(np.searchsorted(student_ids, row_students), len(student_ids) - 1)
+        known = student_ids[index] == row_students
+        day = (np.array(row_days, dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+        index, day = index[known], day[known]
+        attendance[index, day] = (np.array(row_categories, dtype=np.int64)[known] & PRESENCE_BIT) > 0
+        points[index, day] = np.array([t or 0 for t in row_totals], dtype=np.int32)[known]
+
+    return AttendanceMatrix(student_ids, names, groups, start_date, attendance, points)
+
+def run_lengths(mask: np.ndarray) -> np.ndarray:
+    # Length of the run of True values ending at each column, per row.
+    columns = np.arange(mask.shape[1])
+    last_break = np.maximum.accumulate(np.where(mask, -1, columns), axis=1)
+    return np.where(mask, columns - last_break, 0)
+
+def analyse(matrix: AttendanceMatrix) -> dict:
+    # Only called for events that have started, so there is at least one day.
+    attendance, days = matrix.attendance, matrix.days
+    attended_days = attendance.sum(axis=1)
+    streaks = run_lengths(attendance)
+    absences = run_lengths(~attendance)
+
+    window = attendance[:, -LOW_ATTENDANCE_WINDOW:]
+    recent_attendance = window.sum(axis=1)
+    engagement_score = matrix.points.sum(axis=1) / (days * settings.MAX_DAILY_POINTS) * 100
+    first_day = attendance[:, 0]
+
+    return {
+        "attended_days": attended_days,
+        "current_streak": streaks[:, -1],
+        "longest_streak": streaks.max(axis=1),
+        "missed_in_a_row": absences[:, -1],
+        "engagement_score": engagement_score,
+        "low_attendance": recent_attendance < min(LOW_ATTENDANCE_DAYS, window.shape[1]),
+        "low_engagement": (attended_days > 0) & (engagement_score < LOW_ENGAGEMENT_SCORE),
+        "likely_to_drop": (attended_days > 0) & (absences[:, -1] >= DROP_AFTER_MISSED_DAYS),
+        "present": attendance.sum(axis=0),
+        "reached": np.maximum.accumulate(attendance, axis=1).sum(axis=0),
+        "day_one_retained": attendance[first_day].sum(axis=0),
+        "day_one_count": int(first_day.sum()),
+    }
+
+def _round(value) -> float:
+    return round(float(value), 1)
+
+def summarise(matrix: AttendanceMatrix, limit: int = AT_RISK_LIMIT) -> dict:
+    metrics = analyse(matrix)
+    flags = ("low_attendance", "low_engagement", "likely_to_drop")
+    risk = sum(metrics[f].astype(np.int8) for f in flags)
+    # Most flags first, then the least engaged.
+    ranked = np.lexsort((metrics["engagement_score"], -risk))
+    ranked = ranked[risk[ranked] > 0][:limit]
+    students = len(matrix.student_ids)
+
+    return {
+        "at_risk_participants": {f: int(metrics[f].sum()) for f in flags},
+        "at_risk_students": [{
+            "student_id": str(matrix.student_ids[i]),
+            "name": str(matrix.names[i]),
+            "class": str(matrix.groups[i]),
+            "days_attended": int(metrics["attended_days"][i]),
+            "missed_in_a_row": int(metrics["missed_in_a_row"][i]),
+            "engagement_score": _round(metrics["engagement_score"][i]),
+            "flags": [f for f in flags if metrics[f][i]],
+        } for i in ranked],
+        "streaks": {
+            "average_current": _round(metrics["current_streak"].mean()) if students else 0,
+            "longest": int(metrics["longest_streak"].max()) if students else 0,
+            "perfect_attendance": int((metrics["attended_days"] == matrix.days).sum()),
+        },
+        "engagement": {
+            "average_score": _round(metrics["engagement_score"].mean()) if students else 0,
+            "median_score": _round(np.median(metrics["engagement_score"])) if students else 0,
+        },
+        "retention": [{
+            "day": i + 1,
+            "date": (matrix.start_date + timedelta(days=i)).isoformat(),
+            "present": int(metrics["present"][i]),
+            "reached": int(metrics["reached"][i]),
+            "retention_rate": _round(metrics["present"][i] / metrics["reached"][i] * 100) if metrics["reached"][i] else 0,
+            "day_one_retention": _round(metrics["day_one_retained"][i] / metrics["day_one_count"] * 100) if metrics["day_one_count"] else 0,
+        } for i in range(matrix.days)],
+    }
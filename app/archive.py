@@ -0,0 +1,170 @@
+import argparse
+import functools
+import os
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import structlog
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from . import models, changes, events
+from .config import settings
+from .database import site_session, site_of
+
+logger = structlog.get_logger(__name__)
+
+# Archives are plain .npz files: one compressed column per array, no pickled
+# objects, so they can be loaded read-only without trusting their contents.
+def archive_path(event_id: int, site: str = None) -> str:
+    directory = os.path.join(settings.ARCHIVE_DIR, f"site-{site}") if site else settings.ARCHIVE_DIR
+    return os.path.join(directory, f"event-{event_id}.npz")
+
+def _text(values) -> np.ndarray:
+    return np.array([v or "" for v in values], dtype=str)
+
+def export_event(db: Session, event: models.Event) -> str:
+    points = db.query(models.Points.student_id, models.Points.award_date, models.Points.categories, models.Points.total) \
+        .filter(models.Points.event_id == event.id) \
+        .order_by(models.Points.award_date, models.Points.student_id) \
+        .all()
+    students = db.query(models.Student.id, models.Student.name, models.Student.age, models.Student.gender, models.Student.group) \
+        .filter(or_(
+            models.Student.id.in_(events.enrolled_students(event.id)),
+            models.Student.id.in_(select(models.Points.student_id).where(models.Points.event_id == event.id))
+        )) \
+        .order_by(models.Student.id) \
+        .all()
+
+    student_ids = _text(s.id for s in students)
+    columns = {
+        "event": np.array([event.id, event.start_date.toordinal(), event.end_date.toordinal()], dtype=np.int64),
+        "event_name": np.array([event.name or ""], dtype=str),
+        "student_id": student_ids,
+        "student_name": _text(s.name for s in students),
+        "student_age": np.array([s.age or 0 for s in students], dtype=np.int16),
+        "student_gender": _text(s.gender for s in students),
+        "student_group": _text(s.group for s in students),
+        # Points reference students by their row in the student columns.
+        "points_student": np.searchsorted(student_ids, _text(p.student_id for p in points)).astype(np.int32),
+        "points_day": np.array([p.award_date for p in points], dtype="datetime64[D]"),
+        "points_categories": np.array([p.categories or 0 for p in points], dtype=np.uint8),
+        "points_total": np.array([p.total or 0 for p in points], dtype=np.int32),
+    }
+
+    path = archive_path(event.id, site_of(db))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp_path, path)
+    return path
+
+def archive_event(db: Session, event_id: int, force: bool = False) -> models.Event:
+    event = db.get(models.Event, event_id)
+    if event is None:
+        raise ValueError(f"Event {event_id} not found")
+    if event.status == events.ARCHIVED:
+        raise ValueError(f"Event {event_id} is already archived")
+    if event.end_date >= date.today() and not force:
+        raise ValueError(f"Event {event_id} has not finished yet")
+
+    started = time.perf_counter()
+    path = export_event(db, event)
+    rows = db.query(models.Points).filter(models.Points.event_id == event.id).delete(synchronize_session=False)
+    db.query(models.Enrolment).filter(models.Enrolment.event_id == event.id).delete(synchronize_session=False)
+    event.status = events.ARCHIVED
+    event.archive_path = path
+    changes.record(db, changes.EVENT, event.id, changes.ARCHIVE)
+    db.commit()
+    logger.info("event archived", event_id=event.id, points=rows, path=path, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return event
+
+@functools.lru_cache(maxsize=8)
+def _load(path: str, mtime: float) -> dict:
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+def load_archive(path: str) -> dict:
+    return _load(path, os.path.getmtime(path))
+
+def _rate(numerator, denominator) -> float:
+    return round(numerator / denominator * 100, 1) if denominator else 0
+
+def archive_summary(path: str, top: int = 10) -> dict:
+    data = load_archive(path)
+    event_id, start, end = (int(v) for v in data["event"])
+    students = data["student_id"]
+    student_index = data["points_student"]
+    categories = data["points_categories"]
+    totals = data["points_total"]
+    days = data["points_day"]
+
+    present = (categories & models.CATEGORY_BITS["presence"]) > 0
+    per_student = np.bincount(student_index, weights=totals, minlength=len(students)).astype(np.int64)
+    attended = np.bincount(student_index[present], minlength=len(students))
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    daily_attendance = np.bincount(day_index[present], minlength=len(unique_days))
+    daily_points = np.bincount(day_index, weights=totals, minlength=len(unique_days))
+    total_days = end - start + 1
+
+    by_class = {}
+    for group in np.unique(data["student_group"]):
+        members = data["student_group"] == group
+        by_class[str(group)] = {
+            "student_count": int(members.sum()),
+            "total_points": int(per_student[members].sum()),
+            "attendance_rate": _rate(int(attended[members].sum()), int(members.sum()) * total_days),
+        }
+
+    ranking = np.argsort(-per_student, kind="stable")[:top]
+    return {
+        "event_id": event_id,
+        "event_name": str(data["event_name"][0]),
+        "start_date": date.fromordinal(start).isoformat(),
+        "end_date": date.fromordinal(end).isoformat(),
+        "total_days": total_days,
+        "total_registered": len(students),
+        "total_points_awarded": int(totals.sum()),
+        "average_daily_attendance": round(int(present.sum()) / total_days, 1),
+        "daily": [{
+            "date": str(day),
+            "attendance": int(daily_attendance[i]),
+            "points": int(daily_points[i]),
+        } for i, day in enumerate(unique_days)],
+        "categories": {
+            name: int(((categories & bit) > 0).sum())
+            for name, bit in models.CATEGORY_BITS.items()
+        },
+        "by_class": by_class,
+        "top_students": [{
+            "student_id": str(students[i]),
+            "name": str(data["student_name"][i]),
+            "class": str(data["student_group"][i]),
+            "total_points": int(per_student[i]),
+            "days_attended": int(attended[i]),
+        } for i in ranking],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a finished event's points into a compressed archive file.")
+    parser.add_argument("event_id", type=int)
+    parser.add_argument("--force", action="store_true", help="archive even if the event has not ended")
+    parser.add_argument("--site", help="a site from SITES; defaults to the primary database")
+    args = parser.parse_args()
+    if args.site and args.site not in settings.SITES:
+        parser.error(f"unknown site: {args.site}")
+
+    db = site_session(args.site)
+    try:
+        event = archive_event(db, args.event_id, force=args.force)
+        print(f"Archived event {event.id} to {event.archive_path}")
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
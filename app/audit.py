@@ -0,0 +1,110 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import structlog
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import site_session, site_of
+
+logger = structlog.get_logger(__name__)
+
+def _utc(value: datetime) -> datetime:
+    # Stored timestamps are UTC; naive query bounds are taken to be UTC too.
+    return value.astimezone(timezone.utc) if value and value.tzinfo else value
+
+# Pages are keyed on id, newest first: `before` is the smallest id of the
+# previous page, so every page is an index range scan however deep it is.
+def query_logs(db: Session, user_id: int = None, action: str = None, since: datetime = None, until: datetime = None,
+               before: int = None, limit: int = 100) -> dict:
+    since, until = _utc(since), _utc(until)
+    query = db.query(models.AuditLog)
+    if user_id is not None:
+        query = query.filter(models.AuditLog.user_id == user_id)
+    if action:
+        query = query.filter(models.AuditLog.action == action)
+    if since:
+        query = query.filter(models.AuditLog.timestamp >= since)
+    if until:
+        query = query.filter(models.AuditLog.timestamp < until)
+    if before:
+        query = query.filter(models.AuditLog.id < before)
+    rows = query.order_by(models.AuditLog.id.desc()).limit(limit + 1).all()
+    return {"items": rows[:limit], "next_before": rows[limit - 1].id if len(rows) > limit else None}
+
+def archive_dir(site: str = None) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, f"site-{site}", "audit") if site else os.path.join(settings.ARCHIVE_DIR, "audit")
+
+def _write_batch(rows: list, site: str = None) -> str:
+    directory = archive_dir(site)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"audit-{rows[0].id:012d}-{rows[-1].id:012d}.jsonl.gz")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({
+                "id": row.id,
+                "user_id": row.user_id,
+                "action": row.action,
+                "details": row.details,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+            }) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+# Moves entries older than the retention window into gzipped JSON Lines
+# files, one file and one short transaction per batch, so writers are never
+# blocked behind a large delete. A file is complete before its rows are
+# deleted; a crash in between leaves rows that the next run rewrites.
+def archive_old_logs(db: Session, retention_days: int = None, batch_size: int = None) -> dict:
+    retention_days = settings.AUDIT_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.AUDIT_ARCHIVE_BATCH_SIZE
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    started = time.perf_counter()
+    archived = 0
+    files = []
+    while True:
+        rows = db.query(models.AuditLog) \
+            .filter(models.AuditLog.timestamp < cutoff) \
+            .order_by(models.AuditLog.id) \
+            .limit(batch_size) \
+            .all()
+        if not rows:
+            break
+        files.append(_write_batch(rows, site_of(db)))
+        db.query(models.AuditLog) \
+            .filter(models.AuditLog.id.in_([row.id for row in rows])) \
+            .delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+    if archived:
+        logger.info("audit logs archived", rows=archived, files=len(files), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return {"archived": archived, "files": files, "cutoff": cutoff.isoformat()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Move audit log entries past the retention window into compressed archive files.")
+    parser.add_argument("--days", type=int, default=settings.AUDIT_RETENTION_DAYS, help="keep entries newer than this many days")
+    parser.add_argument("--batch-size", type=int, default=settings.AUDIT_ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--site", help="a site from SITES; defaults to the primary database")
+    args = parser.parse_args()
+    if args.site and args.site not in settings.SITES:
+        parser.error(f"unknown site: {args.site}")
+
+    db = site_session(args.site)
+    try:
+        result = archive_old_logs(db, retention_days=args.days, batch_size=args.batch_size)
+        print(f"Archived {result['archived']} audit log entries older than {result['cutoff']} into {len(result['files'])} file(s) in {archive_dir(args.site)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
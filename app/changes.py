@@ -0,0 +1,64 @@
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from . import models, shared_state
+from .database import site_of
+
+STUDENT = "student"
+POINTS = "points"
+EVENT = "event"
+ENROLMENT = "enrolment"
+UPSERT = "upsert"
+DELETE = "delete"
+ARCHIVE = "archive"
+
+def record(db: Session, entity: str, entity_id, op: str = UPSERT, topic: str = None):
+    db.add(models.ChangeLog(entity=entity, entity_id=str(entity_id), op=op))
+    if topic is None:
+        topic = {STUDENT: shared_state.ROSTER, EVENT: shared_state.EVENTS}.get(entity, shared_state.POINTS)
+    db.info.setdefault("changed_topics", set()).add(topic)
+
+@event.listens_for(Session, "after_commit")
+def _bump_generations(db):
+    # Bump only once the data is visible, so other workers never cache
+    # pre-commit state under the new generation.
+    for topic in db.info.pop("changed_topics", ()):
+        shared_state.state.bump(topic, site_of(db))
+
+@event.listens_for(Session, "after_rollback")
+def _discard_generations(db):
+    db.info.pop("changed_topics", None)
+
+def latest_seq(db: Session) -> int:
+    return db.query(func.max(models.ChangeLog.seq)).scalar() or 0
+
+def get_changes(db: Session, since: int = 0, limit: int = 1000):
+    rows = db.query(models.ChangeLog.seq, models.ChangeLog.entity, models.ChangeLog.entity_id, models.ChangeLog.op) \
+        .filter(models.ChangeLog.seq > since) \
+        .order_by(models.ChangeLog.seq) \
+        .limit(limit + 1) \
+        .all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Only the latest operation per entity matters to a client catching up.
+    latest = {}
+    for _, entity, entity_id, op in rows:
+        latest[(entity, entity_id)] = op
+
+    upserted_students = [i for (e, i), op in latest.items() if e == STUDENT and op == UPSERT]
+    upserted_points = [int(i) for (e, i), op in latest.items() if e == POINTS and op == UPSERT]
+
+    students = db.query(models.Student).filter(models.Student.id.in_(upserted_students)).all() if upserted_students else []
+    points = db.query(models.Points).filter(models.Points.id.in_(upserted_points)).all() if upserted_points else []
+
+    return {
+        "since": since,
+        "next_since": rows[-1].seq if rows else since,
+        "has_more": has_more,
+        "students": students,
+        "deleted_students": [i for (e, i), op in latest.items() if e == STUDENT and op == DELETE],
+        "points": points,
+        "deleted_points": [int(i) for (e, i), op in latest.items() if e == POINTS and op == DELETE],
+        "archived_events": [int(i) for (e, i), op in latest.items() if e == EVENT and op == ARCHIVE],
+    }
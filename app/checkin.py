@@ -0,0 +1,239 @@
+import queue
+import secrets
+import threading
+import time
+from datetime import date
+
+import structlog
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, changes, shared_state, events
+from .config import settings
+from .database import site_session, site_of
+
+logger = structlog.get_logger(__name__)
+
+def generate_code(taken: set) -> str:
+    while True:
+        code = "".join(secrets.choice("0123456789") for _ in range(settings.CHECKIN_CODE_LENGTH))
+        if code not in taken:
+            taken.add(code)
+            return code
+
+class Roster:
+    def __init__(self, site: str = None):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_code = {}
+        self._watcher = shared_state.Watcher(shared_state.ROSTER, site)
+
+    def load(self, db: Session):
+        with self._lock:
+            generation = self._watcher.current()
+            self._assign_missing_codes(db)
+            rows = db.query(
+                models.CheckinCode.code, models.Student.id, models.Student.name, models.Student.group
+            ).join(models.Student).all()
+            self._by_code = {
+                code: {"student_id": student_id, "name": name, "group": group}
+                for code, student_id, name, group in rows
+            }
+            self._watcher.seen = generation
+            self._loaded = True
+
+    def _assign_missing_codes(self, db: Session):
+        missing = db.query(models.Student.id).outerjoin(models.CheckinCode).filter(models.CheckinCode.code == None).all()
+        if not missing:
+            return
+        taken = {code for (code,) in db.query(models.CheckinCode.code)}
+        for (student_id,) in missing:
+            db.add(models.CheckinCode(code=generate_code(taken), student_id=student_id))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker assigned codes concurrently; keep theirs.
+            db.rollback()
+
+    def invalidate(self):
+        self._loaded = False
+
+    def lookup(self, db: Session, code: str):
+        if not self._loaded or self._watcher.is_stale():
+            self.load(db)
+        return self._by_code.get(code)
+
+    def entries(self, db: Session) -> list:
+        if not self._loaded or self._watcher.is_stale():
+            self.load(db)
+        return sorted(({"code": code, **entry} for code, entry in self._by_code.items()), key=lambda e: e["name"] or "")
+
+def merge_presence_marks(db: Session, marks: set):
+    if not marks:
+        return
+    presence_value = settings.POINT_VALUES["PRESENCE"]
+    student_ids = {student_id for student_id, _ in marks}
+    days = {day for _, day in marks}
+
+    existing = {
+        (student_id, award_date): (points_id, presence)
+        for points_id, student_id, award_date, presence in db.query(
+            models.Points.id, models.Points.student_id, models.Points.award_date, models.Points.presence
+        ).filter(models.Points.student_id.in_(student_ids), models.Points.award_date.in_(days))
+    }
+
+    # Both writes are guarded, so several workers flushing marks for the
+    # same student and day count presence once: the INSERT yields to a row
+    # another worker created (unique on student and day), and the UPDATE
+    # only matches a row that is not yet marked present.
+    deltas = {}
+    touched = []
+    for student_id, day in marks:
+        points_id, presence = existing.get((student_id, day), (None, False))
+        if presence:
+            continue
+        inserted = None
+        if points_id is None:
+            event_id = events.calendar.event_id_for(db, day)
+            inserted = db.execute(
+                insert(models.Points)
+                .values(student_id=student_id, event_id=event_id, award_date=day, presence=True,
+                        categories=models.CATEGORY_BITS["presence"], total=presence_value)
+                .on_conflict_do_nothing(index_elements=["student_id", "award_date"])
+                .returning(models.Points.id)
+            ).scalar()
+            if inserted is not None:
+                events.ensure_enrolled(db, event_id, [student_id])
+        points_id = inserted
+        if points_id is None:
+            points_id = db.execute(
+                update(models.Points)
+                .where(models.Points.student_id == student_id, models.Points.award_date == day, models.Points.presence == False)
+                .values({
+                    models.Points.presence: True,
+                    models.Points.categories: models.Points.categories.op("|")(models.CATEGORY_BITS["presence"]),
+                    models.Points.total: func.coalesce(models.Points.total, 0) + presence_value
+                })
+                .returning(models.Points.id)
+            ).scalar()
+            if points_id is None:
+                continue
+        touched.append(points_id)
+        deltas[student_id] = deltas.get(student_id, 0) + presence_value
+
+    for student_id, delta in deltas.items():
+        db.query(models.Student).filter(models.Student.id == student_id).update(
+            {models.Student.total_points: func.coalesce(models.Student.total_points, 0) + delta},
+            synchronize_session=False
+        )
+        changes.record(db, changes.STUDENT, student_id, topic=shared_state.POINTS)
+    for points_id in touched:
+        changes.record(db, changes.POINTS, points_id)
+    db.commit()
+
+class CheckinWriter:
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._marked_day = None
+        self._marked = set()
+
+    def submit(self, student_id: str, day: date, site: str = None) -> bool:
+        with self._lock:
+            if day != self._marked_day:
+                self._marked_day = day
+                self._marked = set()
+            if (site, student_id, day) in self._marked:
+                return False
+            self._marked.add((site, student_id, day))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="checkin-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((site, student_id, day, 0))
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = {item}
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while len(batch) < self.batch_size:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    if item is None:
+                        self._flush(batch)
+                        self._drain()
+                        return
+                    batch.add(item)
+            except queue.Empty:
+                pass
+            self._flush(batch)
+
+    def _drain(self):
+        # Marks requeued after the stop sentinel get one last attempt.
+        batch = set()
+        while True:
+            try:
+                batch.add(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._flush(batch, retry=False)
+
+    def _flush(self, batch: set, retry: bool = True):
+        by_site = {}
+        for site, student_id, day, attempt in batch:
+            marks = by_site.setdefault(site, {})
+            marks[(student_id, day)] = max(attempt, marks.get((student_id, day), 0))
+        for site, marks in by_site.items():
+            db = site_session(site)
+            try:
+                merge_presence_marks(db, set(marks))
+                logger.info("checkin batch flushed", marks=len(marks), site=site)
+            except Exception:
+                db.rollback()
+                logger.exception("checkin batch failed", marks=len(marks), site=site)
+                self._requeue(site, marks, retry)
+            finally:
+                db.close()
+
+    # The kiosk was already told the mark is queued, so a failed batch goes
+    # back on the queue after a pause. Marks that run out of attempts are
+    # forgotten, so scanning the code again queues them afresh.
+    def _requeue(self, site: str, marks: dict, retry: bool):
+        dropped = set()
+        for (student_id, day), attempt in marks.items():
+            if retry and attempt < settings.CHECKIN_MAX_RETRIES:
+                self._queue.put((site, student_id, day, attempt + 1))
+            else:
+                dropped.add((site, student_id, day))
+        if dropped:
+            with self._lock:
+                self._marked -= dropped
+            logger.error("checkin marks dropped", marks=len(dropped), site=site)
+        if retry and len(dropped) < len(marks):
+            time.sleep(self.flush_interval)
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+rosters = {}
+_rosters_lock = threading.Lock()
+
+def roster_for(db: Session) -> Roster:
+    site = site_of(db)
+    with _rosters_lock:
+        if site not in rosters:
+            rosters[site] = Roster(site)
+        return rosters[site]
+
+writer = CheckinWriter(settings.CHECKIN_BATCH_SIZE, settings.CHECKIN_FLUSH_INTERVAL)
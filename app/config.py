@@ -23,6 +23,68 @@ class Settings(BaseSettings):
 
     MAX_DAILY_POINTS: int = 165
 
+    DEFAULT_EVENT_NAME: str = "Escola Biblica de Ferias 2025"
+    ARCHIVE_DIR: str = "archive"
+
+    AUDIT_RETENTION_DAYS: int = 90 # 0 keeps every entry in the database
+    AUDIT_RETENTION_INTERVAL: float = 3600
+    AUDIT_ARCHIVE_BATCH_SIZE: int = 5000
+
+    DB_PROFILE: str = "auto" # auto, local, remote
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_CONNECT_RETRIES: int = 3
+    DB_CONNECT_BACKOFF: float = 0.5
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64 * 1024 # negative values are KiB
+    SQLITE_BUSY_TIMEOUT: int = 5000
+
+    READ_REPLICA_URL: str = ""
+
+    SITES: dict = {} # site name -> database URL; users without a site use DATABASE_URL
+    SITE_QUERY_TIMEOUT: float = 10
+    REPLICA_MAX_STALENESS: float = 5
+
+    WARM_ON_STARTUP: bool = False
+    POOL_PREWARM_CONNECTIONS: int = 2
+
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATE: float = 1.0 # share of successful, fast requests that are logged
+    LOG_SLOW_REQUEST_MS: float = 1000
+
+    PROFILE_HISTORY: int = 20 # profiles kept for GET /profiles
+
+    WORKERS: int = 1
+    RELOAD: bool = False
+    SHARED_STATE_DIR: str = ""
+
+    STATS_SCHEDULER_ENABLED: bool = True
+    STATS_REFRESH_INTERVAL: float = 30
+    STATS_REFRESH_AFTER_WRITES: int = 50
+    STATS_MAX_STALENESS: float = 300
+
+    STATS_ROUTE_CONCURRENCY: int = 2
+    STATS_ROUTE_LIMITS: dict = {} # per-path overrides, e.g. {"/stats/performance": 1}
+    STATS_TOTAL_CONCURRENCY: int = 8
+    STATS_QUEUE_SIZE: int = 32
+    STATS_QUEUE_TIMEOUT: float = 10
+    STATS_RETRY_AFTER: int = 2
+
+    DISTRIBUTION_BINS: list = [100, 200, 300]
+    DISTRIBUTION_PERCENTILES: list = [25, 50, 75, 90]
+    DISTRIBUTION_EXACT_LIMIT: int = 200000 # above this, percentiles come from a streaming sketch
+    DISTRIBUTION_SKETCH_ACCURACY: float = 0.01
+
+    CHECKIN_CODE_LENGTH: int = 6
+    CHECKIN_BATCH_SIZE: int = 50
+    CHECKIN_FLUSH_INTERVAL: float = 0.25
+    CHECKIN_MAX_RETRIES: int = 3 # a failed batch is requeued this many times before its marks are dropped
+
     class Config:
         env_file = ".env"
 
@@ -1,17 +1,17 @@
-from sqlalchemy.orm import Session
-from . import models, schemas, security
+from sqlalchemy.orm import Session, aliased, contains_eager
+from . import models, schemas, security, search, checkin, changes, shared_state, engagement, events, analytics, distribution
 from .config import settings
 import uuid
 from datetime import date, timedelta
 from sqlalchemy import func, case
-import statistics
+from sqlalchemy.exc import IntegrityError
 
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = security.get_password_hash(user.password)
-    db_user = models.User(username=user.username, hashed_password=hashed_password, role=user.role)
+    db_user = models.User(username=user.username, hashed_password=hashed_password, role=user.role, site=user.site)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
@@ -28,23 +28,25 @@ def get_age_group(age: int) -> str:
         return "13-15"
     return "N/A"
 
+def category_weights() -> list:
+    return [settings.POINT_VALUES[name.upper()] for name in models.POINT_CATEGORIES]
+
 def calculate_points(points_data: schemas.PointsBase) -> int:
-    total = 0
-    if points_data.presence: total += settings.POINT_VALUES["PRESENCE"]
-    if points_data.book: total += settings.POINT_VALUES["BOOK"]
-    if points_data.versicle: total += settings.POINT_VALUES["VERSICLE"]
-    if points_data.participation: total += settings.POINT_VALUES["PARTICIPATION"]
-    if points_data.guest: total += settings.POINT_VALUES["GUEST"]
-    if points_data.game: total += settings.POINT_VALUES["GAME"]
-    return total
-
-def recalculate_student_total_points(db: Session, student_id: str):
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
-    if student:
-        total_points = sum(p.total for p in student.points_records)
-        student.total_points = total_points
-        db.commit()
-        db.refresh(student)
+    mask = models.category_mask(points_data)
+    return sum(weight for i, weight in enumerate(category_weights()) if mask >> i & 1)
+
+def category_count_columns() -> list:
+    # SUM(categories & bit) == times_awarded * bit, so all six counts come
+    # out of a single pass over the rows.
+    return [func.coalesce(func.sum(models.Points.categories.op("&")(bit)), 0) for bit in models.CATEGORY_BITS.values()]
+
+def category_counts(sums) -> dict:
+    return {name: total // bit for (name, bit), total in zip(models.CATEGORY_BITS.items(), sums)}
+
+def recalculate_student_total_points(db: Session, student: models.Student):
+    student.total_points = db.query(func.coalesce(func.sum(models.Points.total), 0)) \
+        .filter(models.Points.student_id == student.id) \
+        .scalar()
 
 def get_student_by_name(db: Session, name: str):
     return db.query(models.Student).filter(models.Student.name == name).first()
@@ -52,9 +54,52 @@ def get_student_by_name(db: Session, name: str):
 def get_student(db: Session, student_id: str):
     return db.query(models.Student).filter(models.Student.id == student_id).first()
 
-def get_students(db: Session, age_group: str = None, gender: str = None, min_age: int = None, max_age: int = None, sort_by: str = None, order: str = "asc", skip: int = 0, limit: int = 100):
-    query = db.query(models.Student)
+def get_student_detail(db: Session, student_id: str, date_from: date = None, date_to: date = None, limit: int = 100):
+    points_query = db.query(models.Points).filter(models.Points.student_id == student_id)
+    if date_from:
+        points_query = points_query.filter(models.Points.award_date >= date_from)
+    if date_to:
+        points_query = points_query.filter(models.Points.award_date <= date_to)
+    points_query = points_query.order_by(models.Points.award_date.desc()).limit(limit)
+
+    points_alias = aliased(models.Points, points_query.subquery())
+    students = db.query(models.Student) \
+        .outerjoin(points_alias, models.Student.points_records.of_type(points_alias)) \
+        .options(contains_eager(models.Student.points_records.of_type(points_alias))) \
+        .filter(models.Student.id == student_id) \
+        .order_by(points_alias.award_date.desc()) \
+        .populate_existing() \
+        .all()
+    return students[0] if students else None
+
+def get_student_points_summary(db: Session, student_id: str):
+    days_recorded, total, *sums = db.query(
+        func.count(models.Points.id),
+        func.coalesce(func.sum(models.Points.total), 0),
+        *category_count_columns()
+    ).filter(models.Points.student_id == student_id).one()
+
+    return {
+        "days_recorded": days_recorded,
+        "total": total,
+        "categories": {
+            name: {"times_awarded": n, "points": n * settings.POINT_VALUES[name.upper()]}
+            for name, n in category_counts(sums).items()
+        }
+    }
 
+def search_students(db: Session, query: str, limit: int = 10):
+    search.index_for(db).ensure_loaded(db)
+    return search.index_for(db).search(query, limit=limit)
+
+STUDENT_LIST_COLUMNS = (
+    models.Student.name, models.Student.notes, models.Student.age, models.Student.gender,
+    models.Student.parent_name, models.Student.parent_phone, models.Student.address,
+    models.Student.id, models.Student.group, func.coalesce(models.Student.total_points, 0).label("total_points"),
+    models.Student.created_at,
+)
+
+def _filter_students(query, age_group: str = None, gender: str = None, min_age: int = None, max_age: int = None, sort_by: str = None, order: str = "asc", skip: int = 0, limit: int = 100):
     if age_group:
         if age_group == "custom":
             if min_age is not None:
@@ -75,7 +120,27 @@ def get_students(db: Session, age_group: str = None, gender: str = None, min_age
             else:
                 query = query.order_by(column.asc())
 
-    return query.offset(skip).limit(limit).all()
+    return query.offset(skip).limit(limit)
+
+# Same rows as StudentResponse, read as plain tuples: no ORM identity map,
+# no per-row model validation.
+def get_student_rows(db: Session, **filters) -> list:
+    keys = [column.key for column in STUDENT_LIST_COLUMNS]
+    rows = db.execute(_filter_students(db.query(*STUDENT_LIST_COLUMNS), **filters).statement)
+    return [dict(zip(keys, row)) for row in rows]
+
+# A student write, its audit entry, change-log rows and derived fields are
+# flushed together and committed once. Server defaults such as created_at
+# come back through INSERT ... RETURNING where the backend supports it, and
+# instances are not expired on this commit, so the response needs no
+# refresh query.
+def commit_unit(db: Session):
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
 
 def create_student(db: Session, student: schemas.StudentCreate, user_id: int):
     db_student = models.Student(
@@ -90,9 +155,16 @@ def create_student(db: Session, student: schemas.StudentCreate, user_id: int):
         notes=student.notes,
     )
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    changes.record(db, changes.STUDENT, db_student.id)
+    event_id = events.calendar.current_event_id(db)
+    if event_id is not None:
+        # A new student has no enrolments to check against.
+        db.add(models.Enrolment(event_id=event_id, student_id=db_student.id))
+        changes.record(db, changes.ENROLMENT, f"{event_id}:{db_student.id}")
     create_audit_log(db, user_id, "create_student", f"Created student {db_student.id}")
+    commit_unit(db)
+    search.index_for(db).upsert(db_student)
+    checkin.roster_for(db).invalidate()
     return db_student
 
 def update_student(db: Session, student_id: str, student_update: schemas.StudentUpdate, user_id: int):
@@ -107,54 +179,52 @@ def update_student(db: Session, student_id: str, student_update: schemas.Student
     if 'age' in update_data and update_data['age'] is not None:
         db_student.group = get_age_group(db_student.age)
 
-    db.commit()
-    db.refresh(db_student)
+    changes.record(db, changes.STUDENT, db_student.id)
     create_audit_log(db, user_id, "update_student", f"Updated student {db_student.id}")
+    commit_unit(db)
+    search.index_for(db).upsert(db_student)
+    checkin.roster_for(db).invalidate()
     return db_student
 
 def delete_student(db: Session, student_id: str, user_id: int):
-    db_student = get_student(db, student_id)
-    if not db_student:
+    # Dependent rows go first in bulk, instead of loading every points row
+    # to cascade the delete through the ORM.
+    for model in (models.Points, models.CheckinCode, models.Enrolment):
+        db.query(model).filter(model.student_id == student_id).delete(synchronize_session=False)
+    if not db.query(models.Student).filter(models.Student.id == student_id).delete(synchronize_session=False):
+        db.rollback()
         return None
-    create_audit_log(db, user_id, "delete_student", f"Deleted student {db_student.id}")
-    db.delete(db_student)
-    db.commit()
-    return db_student
+    changes.record(db, changes.STUDENT, student_id, changes.DELETE)
+    create_audit_log(db, user_id, "delete_student", f"Deleted student {student_id}")
+    commit_unit(db)
+    search.index_for(db).remove(student_id)
+    checkin.roster_for(db).invalidate()
+    return student_id
+
+# Points are unique per student and day. A concurrent write can create the
+# row between the lookup and the insert; the write is then rolled back and
+# run once more, when it finds and updates that row.
+def _retry_on_conflict(db: Session, write, *args, **kwargs):
+    try:
+        return write(db, *args, **kwargs)
+    except IntegrityError:
+        db.rollback()
+        return write(db, *args, **kwargs)
 
 def award_daily_points(db: Session, student_id: str, points_create: schemas.PointsCreate):
+    return _retry_on_conflict(db, _award_daily_points, student_id, points_create)
+
+def _award_daily_points(db: Session, student_id: str, points_create: schemas.PointsCreate):
     student = get_student(db, student_id)
     if not student:
         return None
 
-    existing_points = db.query(models.Points).filter(
-        models.Points.student_id == student_id,
-        models.Points.award_date == points_create.award_date
-    ).first()
-
-    if existing_points:
-        db.delete(existing_points)
-        db.commit()
-
-    point_details = points_create.points
-    total_daily_points = calculate_points(point_details)
-
-    db_points = models.Points(
-        student_id=student_id,
-        award_date=points_create.award_date,
-        presence=point_details.presence,
-        book=point_details.book,
-        versicle=point_details.versicle,
-        participation=point_details.participation,
-        guest=point_details.guest,
-        game=point_details.game,
-        total=total_daily_points
-    )
-
-    db.add(db_points)
-    db.commit()
-
-    recalculate_student_total_points(db, student_id) 
-    db.refresh(student)
+    # The day's row is updated in place, so concurrent awards for the same
+    # student and day serialise on it instead of each replacing it. The
+    # row, the enrolment and the student's total go in one commit.
+    upsert_daily_points(db, student, points_create.award_date, points_create.points)
+    recalculate_student_total_points(db, student)
+    commit_unit(db)
     return student
 
 
@@ -164,41 +234,165 @@ def adjust_points(db: Session, student_id: str, adjustment: schemas.PointAdjustm
         return None
 
     student.total_points += adjustment.amount
-    db.commit()
-    db.refresh(student)
-    
+    changes.record(db, changes.STUDENT, student_id, topic=shared_state.POINTS)
     details = f"Adjusted points by {adjustment.amount} for student {student_id}. Reason: {adjustment.reason}"
     create_audit_log(db, user_id, "adjust_points", details)
+    commit_unit(db)
     
     return student
 
+def upsert_daily_points(db: Session, student: models.Student, award_date: date, point_details: schemas.PointsBase):
+    db_points = db.query(models.Points).filter(
+        models.Points.student_id == student.id,
+        models.Points.award_date == award_date
+    ).first()
+    previous_total = 0
+    if db_points is None:
+        event_id = events.calendar.event_id_for(db, award_date)
+        db_points = models.Points(student_id=student.id, event_id=event_id, award_date=award_date)
+        db.add(db_points)
+        events.ensure_enrolled(db, event_id, [student.id])
+    else:
+        previous_total = db_points.total or 0
+
+    for key, value in point_details.dict().items():
+        setattr(db_points, key, value)
+    db_points.total = calculate_points(point_details)
+    student.total_points = (student.total_points or 0) + db_points.total - previous_total
+    db.flush()
+    changes.record(db, changes.POINTS, db_points.id)
+    changes.record(db, changes.STUDENT, student.id, topic=shared_state.POINTS)
+    return db_points
+
+def _has_newer_sync_operation(db: Session, operation: str, student_id: str, op_date: date, timestamp):
+    return db.query(models.SyncOperation.id).filter(
+        models.SyncOperation.operation == operation,
+        models.SyncOperation.student_id == student_id,
+        models.SyncOperation.op_date == op_date,
+        models.SyncOperation.status == "applied",
+        models.SyncOperation.client_timestamp > timestamp
+    ).first() is not None
+
+def apply_sync_batch(db: Session, operations: list, user_id: int):
+    return _retry_on_conflict(db, _apply_sync_batch, operations, user_id)
+
+def _apply_sync_batch(db: Session, operations: list, user_id: int):
+    keys = [op.idempotency_key for op in operations]
+    seen = {k for (k,) in db.query(models.SyncOperation.idempotency_key).filter(models.SyncOperation.idempotency_key.in_(keys))}
+    students = {s.id: s for s in db.query(models.Student).filter(models.Student.id.in_({op.student_id for op in operations}))}
+
+    # Results are kept by position: a key repeated within the batch is
+    # applied once and reported as a duplicate only where it repeats.
+    results = [None] * len(operations)
+    updated_students = set()
+    for index in sorted(range(len(operations)), key=lambda i: operations[i].timestamp):
+        op = operations[index]
+        if op.idempotency_key in seen:
+            results[index] = ("duplicate", None)
+            continue
+        seen.add(op.idempotency_key)
+
+        student = students.get(op.student_id)
+        if student is None:
+            results[index] = ("not_found", "Student not found")
+            continue
+
+        op_date = None
+        status, detail = "applied", None
+        if op.type == "award":
+            op_date = op.award.award_date
+            if _has_newer_sync_operation(db, "award", student.id, op_date, op.timestamp):
+                status, detail = "stale", "A newer award for this date was already applied"
+            else:
+                upsert_daily_points(db, student, op_date, op.award.points)
+        elif op.type == "adjust":
+            op_date = op.adjustment.date_adjust
+            student.total_points = (student.total_points or 0) + op.adjustment.amount
+            changes.record(db, changes.STUDENT, student.id, topic=shared_state.POINTS)
+            db.add(models.AuditLog(user_id=user_id, action="adjust_points", details=f"Adjusted points by {op.adjustment.amount} for student {student.id}. Reason: {op.adjustment.reason}"))
+        elif op.type == "update_student":
+            if _has_newer_sync_operation(db, "update_student", student.id, None, op.timestamp):
+                status, detail = "stale", "A newer update for this student was already applied"
+            else:
+                update_data = op.update.dict(exclude_unset=True)
+                for key, value in update_data.items():
+                    setattr(student, key, value)
+                if update_data.get('age') is not None:
+                    student.group = get_age_group(student.age)
+                changes.record(db, changes.STUDENT, student.id)
+                updated_students.add(student.id)
+                db.add(models.AuditLog(user_id=user_id, action="update_student", details=f"Updated student {student.id}"))
+
+        db.add(models.SyncOperation(
+            idempotency_key=op.idempotency_key,
+            operation=op.type,
+            student_id=student.id,
+            op_date=op_date,
+            client_timestamp=op.timestamp,
+            status=status,
+            user_id=user_id
+        ))
+        db.flush()
+        results[index] = (status, detail)
+
+    db.commit()
+    for student_id in updated_students:
+        search.index_for(db).upsert(students[student_id])
+    if updated_students:
+        checkin.roster_for(db).invalidate()
+
+    return [{
+        "idempotency_key": op.idempotency_key,
+        "student_id": op.student_id,
+        "status": status,
+        "detail": detail,
+    } for op, (status, detail) in zip(operations, results)]
+
+def get_events(db: Session):
+    return db.query(models.Event).order_by(models.Event.start_date.desc()).all()
+
+def get_event(db: Session, event_id: int):
+    return db.query(models.Event).filter(models.Event.id == event_id).first()
+
+def create_event(db: Session, event: schemas.EventCreate, user_id: int):
+    db_event = models.Event(name=event.name, start_date=event.start_date, end_date=event.end_date, status=events.ACTIVE)
+    db.add(db_event)
+    db.flush()
+    changes.record(db, changes.EVENT, db_event.id)
+    create_audit_log(db, user_id, "create_event", f"Created event {db_event.id}")
+    db.commit()
+    db.refresh(db_event)
+    return db_event
+
+# Added to the caller's transaction; it is written with the caller's commit.
 def create_audit_log(db: Session, user_id: int, action: str, details: str):
     db_log = models.AuditLog(user_id=user_id, action=action, details=details)
     db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
     return db_log
 
-def get_average_daily_attendance(db: Session, start_date: date, end_date: date):
-    total_attendance = db.query(func.count(models.Points.id)).filter(models.Points.award_date.between(start_date, end_date), models.Points.presence == True).scalar()
-    num_days = (date.today() - start_date).days + 1
+def get_average_daily_attendance(db: Session, start_date: date, end_date: date, event_id: int = None):
+    total_attendance = events.scope_points(db.query(func.count(models.Points.id)), event_id).filter(models.Points.award_date.between(start_date, end_date), models.Points.presence == True).scalar()
+    num_days = (min(date.today(), end_date) - start_date).days + 1
     return total_attendance / num_days if num_days > 0 else 0
 
-def get_total_points_awarded(db: Session):
-    return db.query(func.sum(models.Points.total)).scalar() or 0
+def get_total_points_awarded(db: Session, event_id: int = None):
+    return events.scope_points(db.query(func.sum(models.Points.total)), event_id).scalar() or 0
 
-def get_daily_attendance(db: Session, day: date):
-    return db.query(func.count(models.Points.id)).filter(models.Points.award_date == day, models.Points.presence == True).scalar()
+def get_daily_attendance(db: Session, day: date, event_id: int = None):
+    return events.scope_points(db.query(func.count(models.Points.id)), event_id).filter(models.Points.award_date == day, models.Points.presence == True).scalar()
 
-def get_daily_points(db: Session, day: date):
-    return db.query(func.sum(models.Points.total)).filter(models.Points.award_date == day).scalar() or 0
+def get_daily_points(db: Session, day: date, event_id: int = None):
+    return events.scope_points(db.query(func.sum(models.Points.total)), event_id).filter(models.Points.award_date == day).scalar() or 0
 
-def get_daily_attendance_stats(db: Session, target_date: date, class_id: str = None):
-    base_query = db.query(models.Points).filter(models.Points.award_date == target_date)
+def count_students(db: Session, event_id: int = None):
+    return events.scope_students(db.query(models.Student), event_id).count()
+
+def get_daily_attendance_stats(db: Session, target_date: date, class_id: str = None, event_id: int = None):
+    base_query = events.scope_points(db.query(models.Points), event_id).filter(models.Points.award_date == target_date)
     if class_id:
         base_query = base_query.join(models.Student).filter(models.Student.group == class_id)
     
-    total_students_query = db.query(func.count(models.Student.id))
+    total_students_query = events.scope_students(db.query(func.count(models.Student.id)), event_id)
     if class_id:
         total_students_query = total_students_query.filter(models.Student.group == class_id)
     total_students = total_students_query.scalar()
@@ -219,29 +413,34 @@ def get_daily_attendance_stats(db: Session, target_date: date, class_id: str = N
         "late_arrivals": 0  # Cannot be implemented without arrival time data
     }]
 
-def get_detailed_today_stats(db: Session):
+def get_detailed_today_stats(db: Session, event_id: int = None):
     today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
+    event = events.get_event(db, event_id)
+    start_date, end_date = events.event_dates(event)
+    # Without an event the current week counts as a seven-day event.
+    total_days = (end_date - start_date).days + 1 if event else 7
     
-    total_students = db.query(models.Student).count()
-    present_count = get_daily_attendance(db, today)
+    total_students = count_students(db, event_id)
+    present_count = get_daily_attendance(db, today, event_id)
+    students = events.scope_students(db.query(models.Student), event_id)
+    points = events.scope_points(db.query(models.Points), event_id)
     
     by_gender = {}
     for gender in ['male', 'female', 'other']:
-        total = db.query(models.Student).filter(models.Student.gender == gender).count()
-        present = db.query(models.Points).join(models.Student).filter(models.Points.award_date == today, models.Student.gender == gender, models.Points.presence == True).count()
+        total = students.filter(models.Student.gender == gender).count()
+        present = points.join(models.Student).filter(models.Points.award_date == today, models.Student.gender == gender, models.Points.presence == True).count()
         by_gender[gender] = {"present": present, "total": total, "rate": round(present/total * 100, 1) if total > 0 else 0}
 
     by_class = {}
     for group in settings.AGE_GROUPS.keys():
-        total = db.query(models.Student).filter(models.Student.group == group).count()
-        present = db.query(models.Points).join(models.Student).filter(models.Points.award_date == today, models.Student.group == group, models.Points.presence == True).count()
+        total = students.filter(models.Student.group == group).count()
+        present = points.join(models.Student).filter(models.Points.award_date == today, models.Student.group == group, models.Points.presence == True).count()
         by_class[group] = {"present": present, "total": total, "rate": round(present/total * 100, 1) if total > 0 else 0}
 
     return {
         "day": today.weekday() + 1,
         "date": today.isoformat(),
-        "event_progress": round(((today - start_of_week).days + 1) / 7 * 100, 1),
+        "event_progress": round(((today - start_date).days + 1) / total_days * 100, 1),
         "attendance": {
             "present_count": present_count,
             "total_students": total_students,
@@ -249,20 +448,20 @@ def get_detailed_today_stats(db: Session):
             "by_gender": by_gender,
             "by_class": by_class
         },
-        "points_awarded_today": get_daily_points(db, today),
+        "points_awarded_today": get_daily_points(db, today, event_id),
         "activities_completed": 6, # Static for now
         "upcoming_activities": 2 # Static for now
     }
 
-def get_registration_statistics(db: Session):
-    total_students = db.query(models.Student).count()
+def get_registration_statistics(db: Session, event_id: int = None):
+    total_students = count_students(db, event_id)
     
     # Active defined as having at least one point record in the last 7 days
     seven_days_ago = date.today() - timedelta(days=7)
-    active_students = db.query(func.count(func.distinct(models.Points.student_id))).filter(models.Points.award_date >= seven_days_ago).scalar()
+    active_students = events.scope_points(db.query(func.count(func.distinct(models.Points.student_id))), event_id).filter(models.Points.award_date >= seven_days_ago).scalar()
 
-    by_gender = db.query(models.Student.gender, func.count(models.Student.id)).group_by(models.Student.gender).all()
-    by_class = db.query(models.Student.group, func.count(models.Student.id)).group_by(models.Student.group).all()
+    by_gender = events.scope_students(db.query(models.Student.gender, func.count(models.Student.id)), event_id).group_by(models.Student.gender).all()
+    by_class = events.scope_students(db.query(models.Student.group, func.count(models.Student.id)), event_id).group_by(models.Student.group).all()
 
     return {
         "total_students": total_students,
@@ -273,12 +472,12 @@ def get_registration_statistics(db: Session):
         "registration_completion_rate": 100.0 # Assuming all fields are required for creation
     }
 
-def get_registration_demographics(db: Session):
-    age_dist = db.query(models.Student.age, func.count(models.Student.id).label("count")).group_by(models.Student.age).order_by(models.Student.age).all()
-    gender_dist = db.query(models.Student.gender, func.count(models.Student.id).label("count")).group_by(models.Student.gender).all()
-    class_dist = db.query(models.Student.group, func.count(models.Student.id).label("count")).group_by(models.Student.group).all()
+def get_registration_demographics(db: Session, event_id: int = None):
+    age_dist = events.scope_students(db.query(models.Student.age, func.count(models.Student.id).label("count")), event_id).group_by(models.Student.age).order_by(models.Student.age).all()
+    gender_dist = events.scope_students(db.query(models.Student.gender, func.count(models.Student.id).label("count")), event_id).group_by(models.Student.gender).all()
+    class_dist = events.scope_students(db.query(models.Student.group, func.count(models.Student.id).label("count")), event_id).group_by(models.Student.group).all()
     
-    total_students = db.query(models.Student).count()
+    total_students = count_students(db, event_id)
     if total_students == 0:
         return {
             "age_distribution": [], "gender_distribution": {}, "class_distribution": {}
@@ -290,12 +489,12 @@ def get_registration_demographics(db: Session):
         "class_distribution": {cls: {"count": c, "percentage": round(c/total_students*100, 1)} for cls, c in class_dist}
     }
 
-def get_today_summary(db: Session):
+def get_today_summary(db: Session, event_id: int = None):
     today = date.today()
-    present_count = get_daily_attendance(db, today)
-    total_students = db.query(models.Student).count()
+    present_count = get_daily_attendance(db, today, event_id)
+    total_students = count_students(db, event_id)
     
-    top_performers = db.query(models.Student).join(models.Points).filter(models.Points.award_date == today).order_by(models.Points.total.desc()).limit(5).all()
+    top_performers = events.scope_points(db.query(models.Student).join(models.Points), event_id).filter(models.Points.award_date == today).order_by(models.Points.total.desc()).limit(5).all()
     
     day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
@@ -306,7 +505,7 @@ def get_today_summary(db: Session):
         "present_count": present_count,
         "total_students": total_students,
         "attendance_rate": round(present_count/total_students*100, 1) if total_students > 0 else 0,
-        "points_awarded_today": get_daily_points(db, today),
+        "points_awarded_today": get_daily_points(db, today, event_id),
         "daily_goal_completion": 92.3, # Static for now
         "top_performers_today": [{
             "student_id": p.id, "name": p.name, "gender": p.gender, "class": p.group, 
@@ -315,69 +514,58 @@ def get_today_summary(db: Session):
         "activities_status": {"completed": 6, "in_progress": 1, "upcoming": 1} # Static for now
     }
 
-def get_students_present_today(db: Session):
+def get_students_present_today(db: Session, event_id: int = None):
     today = date.today()
-    present_students = db.query(models.Student).join(models.Points).filter(models.Points.award_date == today, models.Points.presence == True).all()
-    total_students = db.query(models.Student).count()
+    present_students = db.execute(events.scope_points(
+        db.query(models.Student.id, models.Student.name, models.Student.age, models.Student.gender, models.Student.group, models.Points.total)
+        .join(models.Points, models.Points.student_id == models.Student.id), event_id
+    ).filter(models.Points.award_date == today, models.Points.presence == True).statement).all()
+    total_students = count_students(db, event_id)
     
     return {
         "present_count": len(present_students),
         "present_students": [{
-            "id": s.id, "name": s.name, "age": s.age, "gender": s.gender, "class": s.group,
-            "points_today": db.query(models.Points.total).filter(models.Points.student_id == s.id, models.Points.award_date == today).scalar() or 0,
+            "id": student_id, "name": name, "age": age, "gender": gender, "class": group,
+            "points_today": total or 0,
             "arrival_time": "08:45" # Static for now
-        } for s in present_students],
+        } for student_id, name, age, gender, group, total in present_students],
         "absent_count": total_students - len(present_students),
         "absence_rate": round((total_students - len(present_students)) / total_students * 100, 1) if total_students > 0 else 0,
         "late_arrivals": 4 # Static for now
     }
 
-def get_event_engagement(db: Session, day: str, class_id: str, gender: str):
-    base_query = db.query(models.Points)
-    student_query = db.query(models.Student)
-
-    if class_id:
-        base_query = base_query.join(models.Student).filter(models.Student.group == class_id)
-        student_query = student_query.filter(models.Student.group == class_id)
-    if gender:
-        base_query = base_query.join(models.Student).filter(models.Student.gender == gender)
-        student_query = student_query.filter(models.Student.gender == gender)
-
-    total_points_awarded = base_query.with_entities(func.sum(models.Points.total)).scalar() or 0
-    total_students = student_query.count()
-    
-    days_elapsed = (date.today() - (date.today() - timedelta(days=date.today().weekday()))).days + 1
-    max_possible_points = total_students * days_elapsed * settings.MAX_DAILY_POINTS
-    
-    engagement_percent = round(total_points_awarded / max_possible_points * 100, 1) if max_possible_points > 0 else 0
-    
-    participation_points = base_query.filter(models.Points.participation == True).count() * settings.POINT_VALUES['PARTICIPATION']
-    total_participation_possible = student_query.join(models.Points).filter(models.Points.presence==True).count() * settings.POINT_VALUES['PARTICIPATION']
-    participation_rate = round(participation_points / total_participation_possible * 100, 1) if total_participation_possible > 0 else 0
-
+def get_event_engagement(db: Session, day: str, class_id: str, gender: str, event_id: int = None):
+    overall = engagement.breakdown(db, class_id=class_id, gender=gender, event_id=event_id)[0]
     return {
         "event_day": day,
-        "days_elapsed": days_elapsed,
-        "max_possible_points": max_possible_points,
-        "awarded_points": total_points_awarded,
-        "engagement_percent": engagement_percent,
-        "participation_rate": participation_rate,
+        "days_elapsed": overall["days_elapsed"],
+        "max_possible_points": overall["max_possible_points"],
+        "awarded_points": overall["awarded_points"],
+        "engagement_percent": overall["engagement_percent"],
+        "participation_rate": overall["participation_rate"],
         "trend": "increasing",  # Simplified
     }
 
-def get_student_performance_rankings(db: Session, class_id: str, gender: str, day: str, limit: int):
-    query = db.query(models.Student).order_by(models.Student.total_points.desc())
+def get_student_performance_rankings(db: Session, class_id: str, gender: str, day: str, limit: int, event_id: int = None):
+    if event_id:
+        totals = events.event_totals(db, event_id)
+        total_points = func.coalesce(totals.c.total, 0)
+        query = events.scope_students(db.query(models.Student, total_points).outerjoin(totals, totals.c.student_id == models.Student.id), event_id)
+    else:
+        total_points = models.Student.total_points
+        query = db.query(models.Student, total_points)
+    query = query.order_by(total_points.desc())
     if class_id:
         query = query.filter(models.Student.group == class_id)
     if gender:
         query = query.filter(models.Student.gender == gender)
     
     rankings = query.limit(limit).all()
+    total_event_days = events.days_elapsed(events.get_event(db, event_id))
     
     response = []
-    for i, s in enumerate(rankings):
-        days_attended = db.query(func.count(models.Points.id)).filter(models.Points.student_id == s.id, models.Points.presence == True).scalar()
-        total_event_days = (date.today() - (date.today() - timedelta(days=date.today().weekday()))).days + 1
+    for i, (s, total) in enumerate(rankings):
+        days_attended = events.scope_points(db.query(func.count(models.Points.id)), event_id).filter(models.Points.student_id == s.id, models.Points.presence == True).scalar()
         
         response.append({
             "rank": i + 1,
@@ -386,55 +574,46 @@ def get_student_performance_rankings(db: Session, class_id: str, gender: str, da
             "age": s.age,
             "gender": s.gender,
             "class": s.group,
-            "total_points": s.total_points,
+            "total_points": total,
             "days_attended": days_attended,
             "attendance_rate": round(days_attended / total_event_days * 100, 1) if total_event_days > 0 else 0,
-            "avg_daily_points": round(s.total_points / days_attended, 1) if days_attended > 0 else 0
+            "avg_daily_points": round(total / days_attended, 1) if days_attended > 0 else 0
         })
     return response
 
-def get_class_performance_comparison(db: Session):
+def get_class_performance_comparison(db: Session, event_id: int = None):
+    by_class = {b["class"]: b for b in engagement.breakdown(db, by=["class"], event_id=event_id)}
     response = []
     for group_id, group_name in settings.AGE_GROUPS.items():
-        student_count = db.query(models.Student).filter(models.Student.group == group_id).count()
-        if student_count == 0:
+        bucket = by_class.get(group_id)
+        if not bucket:
             continue
-
-        avg_points = db.query(func.avg(models.Student.total_points)).filter(models.Student.group == group_id).scalar() or 0
-        
-        total_attendance = db.query(func.count(models.Points.id)).join(models.Student).filter(models.Student.group == group_id, models.Points.presence == True).scalar()
-        total_event_days = (date.today() - (date.today() - timedelta(days=date.today().weekday()))).days + 1
-        average_attendance_rate = round((total_attendance / student_count) / total_event_days * 100, 1) if student_count > 0 and total_event_days > 0 else 0
-
-        engagement = get_event_engagement(db, 'overall', group_id, None)
-
         response.append({
             "class_id": group_id,
             "class_name": group_name,
-            "student_count": student_count,
-            "average_attendance_rate": average_attendance_rate,
-            "average_points": round(avg_points, 2),
-            "engagement_score": engagement['engagement_percent'],
-            "daily_participation": engagement['participation_rate']
+            "student_count": bucket["student_count"],
+            "average_attendance_rate": bucket["attendance_rate"],
+            "average_points": bucket["average_points"],
+            "engagement_score": bucket["engagement_percent"],
+            "daily_participation": bucket["participation_rate"]
         })
     return response
 
-def get_points_summary_by_category(db: Session, day: str, class_id: str, gender: str):
-    base_query = db.query(models.Points)
+def get_points_summary_by_category(db: Session, day: str, class_id: str, gender: str, event_id: int = None):
+    base_query = events.scope_points(db.query(func.coalesce(func.sum(models.Points.total), 0), *category_count_columns()), event_id)
+    if class_id or gender:
+        base_query = base_query.join(models.Student)
     if class_id:
-        base_query = base_query.join(models.Student).filter(models.Student.group == class_id)
+        base_query = base_query.filter(models.Student.group == class_id)
     if gender:
-        base_query = base_query.join(models.Student).filter(models.Student.gender == gender)
+        base_query = base_query.filter(models.Student.gender == gender)
 
-    total_points_all_categories = base_query.with_entities(func.sum(models.Points.total)).scalar() or 0
+    total_points_all_categories, *sums = base_query.one()
     
     response = []
-    for category in ["presence", "book", "versicle", "participation", "guest", "game"]:
+    for category, times_awarded in category_counts(sums).items():
         category_upper = category.upper()
-        point_value = settings.POINT_VALUES[category_upper]
-        
-        times_awarded = base_query.filter(getattr(models.Points, category) == True).count()
-        total_points = times_awarded * point_value
+        total_points = times_awarded * settings.POINT_VALUES[category_upper]
         
         percentage = round(total_points / total_points_all_categories * 100, 1) if total_points_all_categories > 0 else 0
         
@@ -447,8 +626,8 @@ def get_points_summary_by_category(db: Session, day: str, class_id: str, gender:
         })
     return response
 
-def get_daily_points_trends(db: Session, include_projections: bool, class_id: str):
-    base_query = db.query(models.Points.award_date, func.sum(models.Points.total).label("total_points"))
+def get_daily_points_trends(db: Session, include_projections: bool, class_id: str, event_id: int = None):
+    base_query = events.scope_points(db.query(models.Points.award_date, func.sum(models.Points.total).label("total_points")), event_id)
     if class_id:
         base_query = base_query.join(models.Student).filter(models.Student.group == class_id)
         
@@ -477,79 +656,52 @@ def get_daily_points_trends(db: Session, include_projections: bool, class_id: st
 
     return response
 
-def get_event_points_distribution(db: Session):
-    points_data = db.query(models.Student.total_points).all()
-    points = [p[0] for p in points_data]
-    
-    if not points:
-        return {"distribution": [], "median_points": 0, "average_points": 0, "top_score": 0}
-
-    distribution = {"0-100": 0, "101-200": 0, "201-300": 0, "300+": 0}
-    for p in points:
-        if p <= 100: distribution["0-100"] += 1
-        elif p <= 200: distribution["101-200"] += 1
-        elif p <= 300: distribution["201-300"] += 1
-        else: distribution["300+"] += 1
-            
-    return {
-        "distribution": [{"range": r, "student_count": c, "percentage": round(c/len(points)*100,1)} for r, c in distribution.items()],
-        "median_points": statistics.median(points),
-        "average_points": round(statistics.mean(points), 1),
-        "top_score": max(points)
-    }
-
-def get_performance_analysis(db: Session):
-    male_students = db.query(models.Student).filter(models.Student.gender == 'male').count()
-    female_students = db.query(models.Student).filter(models.Student.gender == 'female').count()
-    
-    male_avg_points = db.query(func.avg(models.Student.total_points)).filter(models.Student.gender == 'male').scalar() or 0
-    female_avg_points = db.query(func.avg(models.Student.total_points)).filter(models.Student.gender == 'female').scalar() or 0
+def get_event_points_distribution(db: Session, event_id: int = None, bins: list = None, percentiles: list = None, by: list = (), class_id: str = None, gender: str = None, approximate: bool = None):
+    return distribution.points_distribution(db, event_id, bins=bins, percentiles=percentiles, by=by, class_id=class_id, gender=gender, approximate=approximate)
 
-    male_engagement = get_event_engagement(db, 'overall', None, 'male')['engagement_percent']
-    female_engagement = get_event_engagement(db, 'overall', None, 'female')['engagement_percent']
+def get_performance_analysis(db: Session, event_id: int = None):
+    by_gender = {b["gender"]: b for b in engagement.breakdown(db, by=["gender"], event_id=event_id)}
+    empty = {"student_count": 0, "average_points": 0, "engagement_percent": 0}
+    male = by_gender.get("male", empty)
+    female = by_gender.get("female", empty)
 
     return {
         "male": {
-            "total_students": male_students,
-            "average_points": round(male_avg_points, 2),
-            "engagement_score": male_engagement
+            "total_students": male["student_count"],
+            "average_points": male["average_points"],
+            "engagement_score": male["engagement_percent"]
         },
         "female": {
-            "total_students": female_students,
-            "average_points": round(female_avg_points, 2),
-            "engagement_score": female_engagement
+            "total_students": female["student_count"],
+            "average_points": female["average_points"],
+            "engagement_score": female["engagement_percent"]
         },
         "comparison": {
-            "points_difference": round(male_avg_points - female_avg_points, 2),
-            "engagement_difference": round(male_engagement - female_engagement, 2)
+            "points_difference": round(male["average_points"] - female["average_points"], 2),
+            "engagement_difference": round(male["engagement_percent"] - female["engagement_percent"], 2)
         }
     }
 
-def get_event_predictions(db: Session):
-    start_of_week = date.today() - timedelta(days=date.today().weekday())
-    days_elapsed = (date.today() - start_of_week).days + 1
+def get_event_predictions(db: Session, event_id: int = None):
+    event = events.get_event(db, event_id)
+    start_date, end_date = events.event_dates(event)
+    total_days = (end_date - start_date).days + 1 if event else 7
+    days_elapsed = events.days_elapsed(event)
     
     if days_elapsed == 0:
         return {"projected_final_attendance": 0, "projected_total_points": 0, "at_risk_participants": 0}
 
-    avg_daily_attendance = get_average_daily_attendance(db, start_of_week, date.today())
-    total_points_awarded = get_total_points_awarded(db)
+    avg_daily_attendance = get_average_daily_attendance(db, start_date, date.today(), event_id)
+    total_points_awarded = get_total_points_awarded(db, event_id)
     avg_daily_points = total_points_awarded / days_elapsed
 
-    projected_total_points = round(total_points_awarded + (avg_daily_points * (7 - days_elapsed)), 0)
-    
-    # At-risk: less than 2 days attendance in the last 7 days
-    seven_days_ago = date.today() - timedelta(days=7)
-    at_risk_students = db.query(models.Student.id).join(models.Points).filter(models.Points.award_date >= seven_days_ago, models.Points.presence == True).group_by(models.Student.id).having(func.count(models.Points.id) < 2).count()
+    projected_total_points = round(total_points_awarded + (avg_daily_points * (total_days - days_elapsed)), 0)
+    total_students = count_students(db, event_id)
 
     return {
-        "remaining_days": 7 - days_elapsed,
+        "remaining_days": total_days - days_elapsed,
         "projected_final_attendance": round(avg_daily_attendance, 1),
         "projected_total_points": projected_total_points,
-        "completion_forecast": round((projected_total_points / (db.query(models.Student).count() * 7 * settings.MAX_DAILY_POINTS)) * 100, 1) if db.query(models.Student).count() > 0 else 0,
-        "at_risk_participants": {
-            "low_attendance": at_risk_students,
-            "low_engagement": 0, # Placeholder
-            "likely_to_drop": 0 # Placeholder
-        }
+        "completion_forecast": round((projected_total_points / (total_students * total_days * settings.MAX_DAILY_POINTS)) * 100, 1) if total_students > 0 else 0,
+        **analytics.summarise(analytics.build_matrix(db, event_id))
     }
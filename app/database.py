@@ -1,13 +1,135 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-)
+pool_counters = {}
+
+def engine_profile(url: str) -> str:
+    if settings.DB_PROFILE != "auto":
+        return settings.DB_PROFILE
+    return "local" if make_url(url).get_backend_name() == "sqlite" else "remote"
+
+def _is_memory_sqlite(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+def _apply_local_pragmas(engine, query_only: bool):
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size = {int(settings.SQLITE_CACHE_SIZE)}")
+        if query_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+def _apply_connect_backoff(engine):
+    @event.listens_for(engine, "do_connect")
+    def _connect_with_backoff(dialect, connection_record, cargs, cparams):
+        for attempt in range(settings.DB_CONNECT_RETRIES):
+            try:
+                return dialect.connect(*cargs, **cparams)
+            except Exception:
+                time.sleep(settings.DB_CONNECT_BACKOFF * 2 ** attempt)
+        return dialect.connect(*cargs, **cparams)
+
+def _track_pool(name: str, engine):
+    counters = pool_counters[name] = Counter()
+    for event_name in ("connect", "checkout", "checkin", "invalidate"):
+        event.listen(engine.pool, event_name, lambda *args, _e=event_name: counters.update((_e,)))
+
+def make_engine(name: str, url: str, query_only: bool = False):
+    profile = engine_profile(url)
+    options = {}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    if profile == "local":
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options.update(pool_pre_ping=True, pool_recycle=settings.DB_POOL_RECYCLE)
+
+    engine = create_engine(url, **options)
+    if profile == "local":
+        _apply_local_pragmas(engine, query_only)
+    else:
+        _apply_connect_backoff(engine)
+    _track_pool(name, engine)
+    return engine
+
+engine = make_engine("primary", SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+# Optional local read replica: replica_engine is used by the refresher to
+# apply changes, read_engine hands out query-only connections to readers.
+replica_engine = None
+read_engine = engine
+if settings.READ_REPLICA_URL:
+    replica_engine = make_engine("replica_writer", settings.READ_REPLICA_URL)
+    read_engine = make_engine("read", settings.READ_REPLICA_URL, query_only=True)
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Sites in settings.SITES keep their students, points, events and audit log
+# in their own database; the primary database serves users without a site
+# and holds the user directory for every site. Engines are created on first
+# use and sessions are tagged with their site, so per-site caches can key
+# on it.
+site_engines = {}
+_site_sessions = {}
+_sites_lock = threading.Lock()
+
+class UnknownSite(Exception):
+    pass
+
+def site_session(site: str = None):
+    if not site:
+        return SessionLocal()
+    if site not in settings.SITES:
+        raise UnknownSite(site)
+    with _sites_lock:
+        if site not in _site_sessions:
+            site_engines[site] = make_engine(f"site:{site}", settings.SITES[site])
+            _site_sessions[site] = sessionmaker(autocommit=False, autoflush=False, bind=site_engines[site], info={"site": site})
+    return _site_sessions[site]()
+
+def site_of(db) -> str:
+    return db.info.get("site")
+
+def pool_statistics() -> dict:
+    engines = {"primary": engine}
+    if replica_engine is not None:
+        engines.update(replica_writer=replica_engine, read=read_engine)
+    engines.update((f"site:{site}", site_engine) for site, site_engine in site_engines.items())
+
+    stats = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        stats[name] = {
+            "profile": engine_profile(str(db_engine.url)),
+            "pool_class": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "status": pool.status(),
+            "events": dict(pool_counters.get(name, {})),
+        }
+    return stats
+
+Base = declarative_base()
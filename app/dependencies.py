@@ -2,22 +2,63 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
-import bleach
 
-from . import crud, schemas, security
+from . import crud, schemas, security, replica, database
 from .database import SessionLocal
 from .config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def get_db():
+def token_claims(request: Request) -> dict:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return {}
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return {}
+
+# The site comes from the token; admins without a site of their own may
+# pick one per request with X-Site. Unauthenticated requests use the
+# primary database.
+def request_site(request: Request):
+    payload = token_claims(request)
+    if not payload:
+        return None
+    if payload.get("role") == "admin" and not payload.get("site"):
+        return request.headers.get("X-Site") or None
+    return payload.get("site")
+
+def get_site(request: Request):
+    site = request_site(request)
+    if site and site not in settings.SITES:
+        raise HTTPException(status_code=400, detail=f"Unknown site: {site}")
+    return site
+
+def get_db(site: str = Depends(get_site)):
+    db = database.site_session(site)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(site: str = Depends(get_site)):
+    # The local replica only follows the primary database.
+    db = database.site_session(site) if site else replica.read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Users of every site are kept in the primary database.
+def get_user_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+def get_current_user(db: Session = Depends(get_user_db), token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,9 +77,13 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
         raise credentials_exception
     return user
 
-async def sanitize_body(request: Request):
-    body = await request.json()
-    for key, value in body.items():
-        if isinstance(value, str):
-            body[key] = bleach.clean(value)
-    return body
+def get_token_role(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload.get("role")
@@ -0,0 +1,211 @@
+import math
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, events, engagement
+from .config import settings
+
+BATCH_SIZE = 10000
+
+def bucket_labels(bins: list) -> list:
+    labels = []
+    lower = 0
+    for upper in bins:
+        labels.append(f"{lower}-{upper}")
+        lower = upper + 1
+    labels.append(f"{bins[-1]}+")
+    return labels
+
+def _percentile_key(q: float) -> str:
+    return f"p{q:g}"
+
+# Relative-error quantile sketch (DDSketch): values are counted in
+# logarithmic buckets, so memory depends on the value range and accuracy,
+# not on how many values were added.
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def _add_to(self, store: dict, magnitudes: np.ndarray):
+        if len(magnitudes):
+            keys, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + count
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        self._add_to(self.positive, values[values > 0])
+        self._add_to(self.negative, -values[values < 0])
+        self.zero += int((values == 0).sum())
+        self.count += len(values)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+def _population_query(db: Session, dims: list, event_id: int = None, class_id: str = None, gender: str = None):
+    columns = [engagement.STUDENT_DIMENSIONS[d].label(d) for d in dims]
+    if event_id:
+        totals = events.event_totals(db, event_id)
+        query = db.query(func.coalesce(totals.c.total, 0).label("points"), *columns) \
+            .select_from(models.Student) \
+            .outerjoin(totals, totals.c.student_id == models.Student.id)
+    else:
+        query = db.query(func.coalesce(models.Student.total_points, 0).label("points"), *columns)
+    if class_id:
+        query = query.filter(models.Student.group == class_id)
+    if gender:
+        query = query.filter(models.Student.gender == gender)
+    return events.scope_students(query, event_id)
+
+def _summary(count: int, total: float, top, percentiles: dict, bucket_counts, labels: list, approximate: bool) -> dict:
+    if count == 0:
+        return {
+            "student_count": 0, "distribution": [], "median_points": 0, "average_points": 0, "top_score": 0,
+            "percentiles": {}, "approximate": approximate,
+        }
+    return {
+        "student_count": count,
+        "distribution": [
+            {"range": label, "student_count": int(c), "percentage": round(int(c) / count * 100, 1)}
+            for label, c in zip(labels, bucket_counts)
+        ],
+        "median_points": percentiles["p50"],
+        "average_points": round(float(total) / count, 1),
+        "top_score": int(top),
+        "percentiles": percentiles,
+        "approximate": approximate,
+    }
+
+def _group_keys(columns: list) -> tuple:
+    # Returns each row's group number and one original key tuple per group.
+    keys = list(zip(*columns))
+    _, first, group = np.unique(np.array(["\x1f".join(map(str, key)) for key in keys]), return_index=True, return_inverse=True)
+    return group, [keys[i] for i in first]
+
+def _exact(rows, dims: list, bins: list, percentiles: list, labels: list) -> tuple:
+    if not rows:
+        return _summary(0, 0, 0, {}, [], labels, False), []
+    columns = list(zip(*rows))
+    values = np.array(columns[0], dtype=np.int64)
+    buckets = np.searchsorted(np.array(bins), values, side="left")
+    quantiles = np.array(percentiles, dtype=float) / 100
+
+    if dims:
+        group, names = _group_keys(columns[1:])
+    else:
+        group, names = np.zeros(len(values), dtype=np.int64), [()]
+
+    # One sort by (group, value) gives every group's order statistics.
+    order = np.lexsort((values, group))
+    ordered = values[order]
+    counts = np.bincount(group, minlength=len(names))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.bincount(group, weights=values, minlength=len(names))
+    tops = ordered[starts + counts - 1]
+    histogram = np.bincount(group * len(labels) + buckets, minlength=len(names) * len(labels)).reshape(len(names), len(labels))
+
+    # Linear interpolation between closest ranks, as numpy.percentile does.
+    positions = starts[:, None] + (counts[:, None] - 1) * quantiles[None, :]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    group_percentiles = ordered[lower] + (ordered[upper] - ordered[lower]) * (positions - lower)
+
+    overall = _summary(
+        len(values), values.sum(), values.max(),
+        {_percentile_key(q): round(float(v), 1) for q, v in zip(percentiles, np.percentile(values, percentiles))},
+        histogram.sum(axis=0), labels, False
+    )
+    groups = [
+        {
+            **dict(zip(dims, names[g])),
+            **_summary(int(counts[g]), sums[g], tops[g], {_percentile_key(q): round(float(v), 1) for q, v in zip(percentiles, group_percentiles[g])}, histogram[g], labels, False),
+        }
+        for g in range(len(names))
+    ]
+    return overall, groups
+
+class _Accumulator:
+    def __init__(self, bins: int):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.sketch = QuantileSketch(settings.DISTRIBUTION_SKETCH_ACCURACY)
+        self.total = 0
+        self.top = None
+
+    def add(self, values: np.ndarray, buckets: np.ndarray):
+        self.counts += np.bincount(buckets, minlength=len(self.counts))
+        self.sketch.add(values)
+        self.total += int(values.sum())
+        self.top = int(values.max()) if self.top is None else max(self.top, int(values.max()))
+
+    def summary(self, percentiles: list, labels: list) -> dict:
+        return _summary(
+            self.sketch.count, self.total, self.top or 0,
+            {_percentile_key(q): round(self.sketch.quantile(q / 100), 1) for q in percentiles},
+            self.counts, labels, True
+        )
+
+def _streaming(result, dims: list, bins: list, percentiles: list, labels: list) -> tuple:
+    edges = np.array(bins)
+    overall = _Accumulator(len(labels))
+    groups = {}
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        values = np.array(columns[0], dtype=np.int64)
+        buckets = np.searchsorted(edges, values, side="left")
+        overall.add(values, buckets)
+        if dims:
+            group, names = _group_keys(columns[1:])
+            for g, name in enumerate(names):
+                mask = group == g
+                groups.setdefault(name, _Accumulator(len(labels))).add(values[mask], buckets[mask])
+    return overall.summary(percentiles, labels), [
+        {**dict(zip(dims, name)), **groups[name].summary(percentiles, labels)}
+        for name in sorted(groups, key=lambda key: "\x1f".join(map(str, key)))
+    ]
+
+def points_distribution(db: Session, event_id: int = None, bins: list = None, percentiles: list = None, by: list = (),
+                        class_id: str = None, gender: str = None, approximate: bool = None) -> dict:
+    bins = sorted(bins or settings.DISTRIBUTION_BINS)
+    percentiles = sorted(set(percentiles or settings.DISTRIBUTION_PERCENTILES) | {50})
+    unknown = [d for d in by if d not in engagement.STUDENT_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+
+    labels = bucket_labels(bins)
+    query = _population_query(db, list(by), event_id, class_id, gender)
+    if approximate is None:
+        approximate = query.count() > settings.DISTRIBUTION_EXACT_LIMIT
+    if approximate:
+        overall, groups = _streaming(db.execute(query.statement).yield_per(BATCH_SIZE), list(by), bins, percentiles, labels)
+    else:
+        overall, groups = _exact(db.execute(query.statement).all(), list(by), bins, percentiles, labels)
+    if by:
+        overall["groups"] = groups
+    return overall
@@ -0,0 +1,105 @@
+from sqlalchemy import and_, func, true
+from sqlalchemy.orm import Session
+
+from . import models, events
+from .config import settings
+
+STUDENT_DIMENSIONS = {
+    "class": models.Student.group,
+    "gender": models.Student.gender,
+    "age": models.Student.age,
+}
+DAY = "day"
+PRESENCE_BIT = models.CATEGORY_BITS["presence"]
+PARTICIPATION_BIT = models.CATEGORY_BITS["participation"]
+DIMENSIONS = list(STUDENT_DIMENSIONS) + [DAY]
+
+def _rate(numerator, denominator) -> float:
+    return round(numerator / denominator * 100, 1) if denominator else 0
+
+def _apply_filters(query, class_id: str = None, gender: str = None):
+    if class_id:
+        query = query.filter(models.Student.group == class_id)
+    if gender:
+        query = query.filter(models.Student.gender == gender)
+    return query
+
+def _point_aggregates():
+    return (
+        func.coalesce(func.sum(models.Points.total), 0).label("awarded"),
+        (func.coalesce(func.sum(models.Points.categories.op("&")(PRESENCE_BIT)), 0) // PRESENCE_BIT).label("attended"),
+        (func.coalesce(func.sum(models.Points.categories.op("&")(PARTICIPATION_BIT)), 0) // PARTICIPATION_BIT).label("participated"),
+    )
+
+def _student_query(db: Session, dims: list, class_id: str, gender: str, event_id: int = None):
+    per_student = events.scope_points(db.query(models.Points.student_id.label("student_id"), *_point_aggregates()), event_id) \
+        .group_by(models.Points.student_id) \
+        .subquery()
+    # Lifetime totals include adjustments; within an event only its awards count.
+    average_points = func.avg(func.coalesce(per_student.c.awarded, 0)) if event_id else func.avg(models.Student.total_points)
+    columns = [STUDENT_DIMENSIONS[d].label(d) for d in dims]
+    query = db.query(
+        *columns,
+        func.count(models.Student.id).label("students"),
+        func.coalesce(average_points, 0).label("average_points"),
+        func.coalesce(func.sum(per_student.c.awarded), 0).label("awarded"),
+        func.coalesce(func.sum(per_student.c.attended), 0).label("attended"),
+        func.coalesce(func.sum(per_student.c.participated), 0).label("participated"),
+    ).outerjoin(per_student, per_student.c.student_id == models.Student.id)
+    return events.scope_students(_apply_filters(query, class_id, gender), event_id).group_by(*columns)
+
+def _daily_query(db: Session, dims: list, class_id: str, gender: str, event_id: int = None):
+    columns = [STUDENT_DIMENSIONS[d].label(d) for d in dims]
+    population = events.scope_students(_apply_filters(db.query(*columns, func.count(models.Student.id).label("students")), class_id, gender), event_id) \
+        .group_by(*columns) \
+        .subquery()
+    daily = events.scope_points(_apply_filters(
+        db.query(models.Points.award_date.label(DAY), *columns, *_point_aggregates()).join(models.Student),
+        class_id, gender
+    ), event_id).group_by(models.Points.award_date, *columns).subquery()
+
+    on = and_(*[daily.c[d] == population.c[d] for d in dims]) if dims else true()
+    return db.query(
+        daily.c[DAY],
+        *[daily.c[d] for d in dims],
+        population.c.students,
+        (daily.c.awarded * 1.0 / population.c.students).label("average_points"),
+        daily.c.awarded,
+        daily.c.attended,
+        daily.c.participated,
+    ).join(population, on).order_by(daily.c[DAY])
+
+def breakdown(db: Session, by: list = (), class_id: str = None, gender: str = None, event_id: int = None) -> list:
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+
+    student_dims = [d for d in by if d != DAY]
+    by_day = DAY in by
+    if by_day:
+        rows = _daily_query(db, student_dims, class_id, gender, event_id).all()
+        days_elapsed = 1
+    else:
+        rows = _student_query(db, student_dims, class_id, gender, event_id).all()
+        days_elapsed = events.days_elapsed(events.get_event(db, event_id))
+
+    dims = ([DAY] if by_day else []) + student_dims
+    buckets = []
+    for row in rows:
+        values = row._mapping
+        students = values["students"]
+        max_possible_points = students * days_elapsed * settings.MAX_DAILY_POINTS
+        key = {d: values[d].isoformat() if d == DAY else values[d] for d in dims}
+        buckets.append({
+            **key,
+            "student_count": students,
+            "days_elapsed": days_elapsed,
+            "average_points": round(values["average_points"] or 0, 2),
+            "awarded_points": values["awarded"],
+            "max_possible_points": max_possible_points,
+            "attendance_count": values["attended"],
+            "attendance_rate": _rate(values["attended"], students * days_elapsed),
+            "engagement_percent": _rate(values["awarded"], max_possible_points),
+            "participation_rate": _rate(values["participated"], values["attended"]),
+        })
+    return buckets
@@ -0,0 +1,98 @@
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, changes, shared_state
+from .database import site_of, site_session
+
+ACTIVE = "active"
+ARCHIVED = "archived"
+
+# Reloaded whenever any worker or the archive CLI commits an event change,
+# so points are never filed under an event that was replaced or archived.
+# Reloads read the primary, which a lagging replica could not vouch for.
+class EventCalendar:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites = {}
+
+    def _load(self, db: Session):
+        site = site_of(db)
+        with self._lock:
+            generation = shared_state.state.generation(shared_state.EVENTS, site)
+            seen, rows = self._sites.get(site, (None, []))
+            if seen != generation:
+                primary = site_session(site)
+                try:
+                    rows = primary.query(models.Event.id, models.Event.start_date, models.Event.end_date, models.Event.status) \
+                        .order_by(models.Event.start_date.desc()) \
+                        .all()
+                finally:
+                    primary.close()
+                self._sites[site] = (generation, rows)
+        return rows
+
+    def event_id_for(self, db: Session, day: date):
+        for event_id, start_date, end_date, status in self._load(db):
+            if status == ACTIVE and start_date <= day <= end_date:
+                return event_id
+        return None
+
+    def current_event_id(self, db: Session):
+        today = date.today()
+        active = [e for e in self._load(db) if e.status == ACTIVE]
+        for event_id, start_date, end_date, _ in active:
+            if start_date <= today <= end_date:
+                return event_id
+        # Between events, report on the latest one that has started.
+        for event_id, start_date, _, _ in active:
+            if start_date <= today:
+                return event_id
+        return active[-1].id if active else None
+
+calendar = EventCalendar()
+
+def ensure_enrolled(db: Session, event_id: int, student_ids):
+    student_ids = set(student_ids)
+    if event_id is None or not student_ids:
+        return
+    existing = {s for (s,) in db.query(models.Enrolment.student_id).filter(
+        models.Enrolment.event_id == event_id, models.Enrolment.student_id.in_(student_ids)
+    )}
+    for student_id in student_ids - existing:
+        db.add(models.Enrolment(event_id=event_id, student_id=student_id))
+        changes.record(db, changes.ENROLMENT, f"{event_id}:{student_id}")
+
+def enrolled_students(event_id: int):
+    return select(models.Enrolment.student_id).where(models.Enrolment.event_id == event_id)
+
+def scope_points(query, event_id: int):
+    return query.filter(models.Points.event_id == event_id) if event_id else query
+
+def event_totals(db: Session, event_id: int):
+    return db.query(models.Points.student_id.label("student_id"), func.sum(models.Points.total).label("total")) \
+        .filter(models.Points.event_id == event_id) \
+        .group_by(models.Points.student_id) \
+        .subquery()
+
+def scope_students(query, event_id: int):
+    return query.filter(models.Student.id.in_(enrolled_students(event_id))) if event_id else query
+
+def get_event(db: Session, event_id: int):
+    return db.get(models.Event, event_id) if event_id else None
+
+def event_dates(event=None) -> tuple:
+    if event is not None:
+        return event.start_date, event.end_date
+    # Without a configured event, the current week is treated as the event.
+    today = date.today()
+    start_of_week = today - timedelta(days=today.weekday())
+    return start_of_week, start_of_week + timedelta(days=4)
+
+def days_elapsed(event=None) -> int:
+    today = date.today()
+    if event is None:
+        return today.weekday() + 1
+    return max((min(today, event.end_date) - event.start_date).days + 1, 0)
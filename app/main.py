@@ -1,24 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime
+import random
+import time
+import uuid
 import structlog
 
-from . import crud, models, schemas, dependencies
-from .database import SessionLocal, engine
+from . import crud, models, schemas, dependencies, database
 from .dependencies import get_db
-from . import auth, statistics
+from . import auth, statistics, checkin, changes, scheduler, warmup, events, archive, admission, profiler, audit
 from .logging_config import setup_logging
+from .responses import FastJSONResponse
+from .config import settings
 
 setup_logging()
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="EBF Management API",
     description="A simple API to manage students, points, and statistics for EBF.",
     version="1.2.0",
 )
+app.router.route_class = profiler.ProfiledRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,18 +33,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def admit_stats_requests(request: Request, call_next):
+    return await admission.gate.handle(request, call_next)
+
+# Outside the admission gate, so a profile includes time spent queued.
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    return await profiler.handle(request, call_next)
+
+# Registered last so it is the outermost middleware and also sees coalesced
+# and rejected stats requests.
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
     structlog.contextvars.clear_contextvars()
     structlog.contextvars.bind_contextvars(
+        request_id=request_id,
         path=request.url.path,
         method=request.method,
-        client_host=request.client.host,
+        client_host=request.client.host if request.client else None,
     )
-    response = await call_next(request)
-    structlog.get_logger().info("request processed")
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        structlog.get_logger().exception("request failed", status_code=500, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        raise
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    response.headers["X-Request-ID"] = request_id
+
+    logger = structlog.get_logger()
+    if response.status_code >= 500:
+        logger.error("request processed", status_code=response.status_code, duration_ms=duration_ms)
+    elif response.status_code >= 400:
+        logger.warning("request processed", status_code=response.status_code, duration_ms=duration_ms)
+    elif duration_ms >= settings.LOG_SLOW_REQUEST_MS:
+        logger.warning("slow request", status_code=response.status_code, duration_ms=duration_ms)
+    elif random.random() < settings.LOG_SAMPLE_RATE:
+        logger.info("request processed", status_code=response.status_code, duration_ms=duration_ms)
     return response
 
+@app.on_event("startup")
+def start_background_workers():
+    # Nothing here may block on the database; schema changes are applied
+    # separately with `alembic upgrade head`.
+    if settings.WARM_ON_STARTUP:
+        warmup.start_background_warmup()
+    if settings.STATS_SCHEDULER_ENABLED:
+        scheduler.scheduler.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    scheduler.scheduler.stop()
+    checkin.writer.stop()
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(statistics.router, prefix="/stats", tags=["statistics"])
 
@@ -47,24 +95,62 @@ app.include_router(statistics.router, prefix="/stats", tags=["statistics"])
 def health_check():
     return {"status": "ok"}
 
+@app.get("/health/pool")
+def pool_statistics(current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return database.pool_statistics()
+
+@app.get("/health/admission")
+def admission_statistics(current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return admission.gate.statistics()
+
+@app.get("/profiles")
+def list_profiles(current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return profiler.list_reports()
+
+@app.get("/profiles/{profile_id}")
+def read_profile(profile_id: str, current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    report = profiler.load_report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
+
+@app.get("/profiles/{profile_id}/download")
+def download_profile(profile_id: str, current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    path = profiler.stats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
 # --- API Endpoints ---
 
 # User Management
 @app.post("/users", response_model=schemas.User, status_code=201)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def create_user(user: schemas.UserCreate, db: Session = Depends(dependencies.get_user_db)):
+    if user.site and user.site not in settings.SITES:
+        raise HTTPException(status_code=400, detail=f"Unknown site: {user.site}")
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     return crud.create_user(db=db, user=user)
 
 @app.get("/users")
-def get_user(username: str, db: Session = Depends(get_db)):
+def get_user(username: str, db: Session = Depends(dependencies.get_user_db)):
     db_user = crud.get_user_by_username(db, username=username)
     return db_user
 
 # Student Management
 @app.post("/students", response_model=schemas.StudentResponse, status_code=201)
-def create_student(student: schemas.StudentBase, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     if current_user.role not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     return crud.create_student(db=db, student=student, user_id=current_user.id)
@@ -82,7 +168,7 @@ def list_students(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
-    return crud.get_students(
+    return FastJSONResponse(crud.get_student_rows(
         db,
         age_group=age_group,
         gender=gender,
@@ -92,20 +178,33 @@ def list_students(
         order=order,
         skip=skip,
         limit=limit
-    )
+    ))
+
+@app.get("/students/search", response_model=List[schemas.StudentSearchResult])
+def search_students(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    return crud.search_students(db, query=q, limit=limit)
 
 @app.get("/students/{student_id}", response_model=schemas.StudentDetailResponse)
-def get_student(student_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_student = crud.get_student(db, student_id=student_id)
+def get_student(
+    student_id: str,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(100, ge=1, le=1000),
+    include_summary: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    db_student = crud.get_student_detail(db, student_id=student_id, date_from=date_from, date_to=date_to, limit=limit)
     if db_student is None:
         raise HTTPException(status_code=404, detail="Student not found")
+    if include_summary:
+        db_student.points_summary = crud.get_student_points_summary(db, student_id=student_id)
     return db_student
 
 @app.put("/students/{student_id}", response_model=schemas.StudentResponse)
-def update_student(student_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user), sanitized_body: dict = Depends(dependencies.sanitize_body)):
+def update_student(student_id: str, student_update: schemas.StudentUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     if current_user.role not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    student_update = schemas.StudentUpdate(**sanitized_body)
     db_student = crud.update_student(db, student_id=student_id, student_update=student_update, user_id=current_user.id)
     if db_student is None:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -125,7 +224,6 @@ def delete_student(student_id: str, db: Session = Depends(get_db), current_user:
 def award_daily_points(student_id: str, points_create: schemas.PointsCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     if current_user.role not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    print(points_create)
     student = crud.award_daily_points(db, student_id=student_id, points_create=points_create)
     if student is None:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -143,6 +241,79 @@ def adjust_student_points(student_id: str, adjustment: schemas.PointAdjustment,
         raise HTTPException(status_code=404, detail="Student not found")
     return student
 
+# Change Feed
+@app.get("/changes", response_model=schemas.ChangesResponse)
+def get_changes(since: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=5000), db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    return changes.get_changes(db, since=since, limit=limit)
+
+# Audit Log
+@app.get("/audit-logs", response_model=schemas.AuditLogPage)
+def list_audit_logs(
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return audit.query_logs(db, user_id=user_id, action=action, since=since, until=until, before=before, limit=limit)
+
+# Offline Sync
+@app.post("/sync", response_model=schemas.SyncResponse)
+def sync_operations(batch: schemas.SyncBatch, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role not in ["admin", "teacher"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {"results": crud.apply_sync_batch(db, operations=batch.operations, user_id=current_user.id)}
+
+# Kiosk Check-in
+@app.get("/checkin/roster", response_model=List[schemas.CheckinRosterEntry])
+def get_checkin_roster(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role not in ["admin", "teacher"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return checkin.roster_for(db).entries(db)
+
+@app.post("/checkin/{code}", response_model=schemas.CheckinResponse, status_code=202)
+def mark_checkin(code: str, db: Session = Depends(get_db), role: str = Depends(dependencies.get_token_role)):
+    if role not in ["admin", "teacher"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    entry = checkin.roster_for(db).lookup(db, code)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown check-in code")
+    today = date.today()
+    queued = checkin.writer.submit(entry["student_id"], today, database.site_of(db))
+    return {**entry, "award_date": today, "status": "queued" if queued else "already_marked"}
+
+# Events
+@app.post("/events", response_model=schemas.Event, status_code=201)
+def create_event(event: schemas.EventCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return crud.create_event(db, event=event, user_id=current_user.id)
+
+@app.get("/events", response_model=List[schemas.Event])
+def list_events(db: Session = Depends(get_db)):
+    return crud.get_events(db)
+
+@app.get("/events/{event_id}", response_model=schemas.Event)
+def get_event(event_id: int, db: Session = Depends(get_db)):
+    event = crud.get_event(db, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return event
+
+@app.get("/events/{event_id}/archive/summary", response_model=dict)
+def get_archived_event_summary(event_id: int, db: Session = Depends(get_db)):
+    event = crud.get_event(db, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.status != events.ARCHIVED:
+        raise HTTPException(status_code=409, detail="Event is not archived, see /stats/event/summary")
+    return archive.archive_summary(event.archive_path)
+
 # Class & Teacher Management
 @app.get("/classes", response_model=List[schemas.ClassResponse])
 def list_classes(db: Session = Depends(get_db)):
@@ -1,15 +1,23 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, DateTime, Index, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 import uuid
 
+# Bit i of Points.categories is set when POINT_CATEGORIES[i] was earned.
+POINT_CATEGORIES = ("presence", "book", "versicle", "participation", "guest", "game")
+CATEGORY_BITS = {name: 1 << i for i, name in enumerate(POINT_CATEGORIES)}
+
+def category_mask(flags) -> int:
+    return sum(bit for name, bit in CATEGORY_BITS.items() if getattr(flags, name))
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     role = Column(String, default="viewer") # admin, teacher, viewer
+    site = Column(String, nullable=True, index=True) # None: the primary database
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     audit_logs = relationship("AuditLog", back_populates="user")
 
@@ -28,11 +36,30 @@ class Student(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_updated = Column(DateTime(timezone=True), onupdate=func.now())
     points_records = relationship("Points", back_populates="student", cascade="all, delete-orphan")
+    checkin_code = relationship("CheckinCode", back_populates="student", uselist=False, cascade="all, delete-orphan")
+    enrolments = relationship("Enrolment", back_populates="student", cascade="all, delete-orphan")
+
+class Event(Base):
+    __tablename__ = "events"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    start_date = Column(Date)
+    end_date = Column(Date)
+    status = Column(String, default="active") # active, archived
+    archive_path = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Enrolment(Base):
+    __tablename__ = "enrolments"
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    student_id = Column(String, ForeignKey("students.id"), primary_key=True, index=True)
+    student = relationship("Student", back_populates="enrolments")
 
 class Points(Base):
     __tablename__ = "points"
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(String, ForeignKey("students.id"))
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=True, index=True)
     award_date = Column(Date)
     presence = Column(Boolean, default=False)
     book = Column(Boolean, default=False)
@@ -40,14 +67,61 @@ class Points(Base):
     participation = Column(Boolean, default=False)
     guest = Column(Boolean, default=False)
     game = Column(Boolean, default=False)
+    categories = Column(Integer, nullable=False, default=0, server_default="0")
     total = Column(Integer)
     student = relationship("Student", back_populates="points_records")
 
+    __table_args__ = (
+        Index("uq_points_student_id_award_date", "student_id", "award_date", unique=True),
+    )
+
+@event.listens_for(Points, "before_insert")
+@event.listens_for(Points, "before_update")
+def _sync_category_mask(mapper, connection, target):
+    target.categories = category_mask(target)
+
+class CheckinCode(Base):
+    __tablename__ = "checkin_codes"
+    code = Column(String, primary_key=True)
+    student_id = Column(String, ForeignKey("students.id"), unique=True, index=True)
+    student = relationship("Student", back_populates="checkin_code")
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     action = Column(String)
     details = Column(String)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     user = relationship("User", back_populates="audit_logs")
+
+    __table_args__ = (
+        Index("ix_audit_logs_user_id_id", "user_id", "id"),
+        Index("ix_audit_logs_action_id", "action", "id"),
+    )
+
+class SyncOperation(Base):
+    __tablename__ = "sync_operations"
+    id = Column(Integer, primary_key=True, index=True)
+    idempotency_key = Column(String, unique=True, index=True)
+    operation = Column(String)
+    student_id = Column(String)
+    op_date = Column(Date, nullable=True)
+    client_timestamp = Column(DateTime(timezone=True))
+    status = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_sync_operations_lww", "operation", "student_id", "op_date", "client_timestamp"),
+    )
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    seq = Column(Integer, primary_key=True)
+    entity = Column(String)
+    entity_id = Column(String)
+    op = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = {"sqlite_autoincrement": True}
@@ -0,0 +1,201 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import shared_state
+from .config import settings
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY = "profile"
+TOP_FUNCTIONS = 50
+
+current = contextvars.ContextVar("profile", default=None)
+
+class Profile:
+    def __init__(self, request: Request):
+        self.id = uuid.uuid4().hex
+        self.path = request.url.path
+        self.method = request.method
+        self.query = request.url.query
+        self.started_at = time.time()
+        self.statements = []
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def add_statement(self, statement: str, duration: float):
+        with self._lock:
+            self.statements.append({"statement": statement, "duration_ms": round(duration * 1000, 2)})
+
+    def stats(self):
+        return pstats.Stats(self.profiler) if self.profiler is not None else None
+
+    def report(self, status_code: int, duration: float) -> dict:
+        functions = []
+        stats = self.stats()
+        if stats is not None:
+            stats.sort_stats("cumulative")
+            for func in stats.fcn_list[:TOP_FUNCTIONS]:
+                primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+                functions.append({
+                    "function": pstats.func_std_string(func),
+                    "calls": calls,
+                    "primitive_calls": primitive_calls,
+                    "total_ms": round(total_time * 1000, 2),
+                    "cumulative_ms": round(cumulative_time * 1000, 2),
+                })
+        return {
+            "id": self.id,
+            "path": self.path,
+            "method": self.method,
+            "query": self.query,
+            "status_code": status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 1),
+            "sql": {
+                "count": len(self.statements),
+                "total_ms": round(sum(s["duration_ms"] for s in self.statements), 2),
+                "statements": self.statements,
+            },
+            "functions": functions,
+        }
+
+# Profiles are files next to the other shared state, so any worker can
+# serve a profile another worker captured.
+def _directory() -> str:
+    directory = os.path.join(shared_state.state.directory, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def _save(profile: Profile, report: dict):
+    directory = _directory()
+    stats = profile.stats()
+    if stats is not None:
+        stats.dump_stats(os.path.join(directory, f"{profile.id}.prof"))
+    with open(os.path.join(directory, f"{profile.id}.json"), "w") as f:
+        json.dump(report, f, default=str)
+    reports = sorted((e for e in os.scandir(directory) if e.name.endswith(".json")), key=lambda e: e.stat().st_mtime)
+    for entry in reports[:-settings.PROFILE_HISTORY]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(directory, entry.name[:-len(".json")] + suffix))
+            except FileNotFoundError:
+                pass
+
+def load_report(profile_id: str):
+    try:
+        with open(os.path.join(_directory(), f"{uuid.UUID(profile_id).hex}.json")) as f:
+            return json.load(f)
+    except (ValueError, FileNotFoundError):
+        return None
+
+def stats_path(profile_id: str):
+    try:
+        path = os.path.join(_directory(), f"{uuid.UUID(profile_id).hex}.prof")
+    except ValueError:
+        return None
+    return path if os.path.exists(path) else None
+
+def list_reports() -> list:
+    reports = []
+    for entry in sorted(os.scandir(_directory()), key=lambda e: e.stat().st_mtime, reverse=True):
+        if entry.name.endswith(".json"):
+            report = load_report(entry.name[:-len(".json")])
+            if report is not None:
+                reports.append({k: report[k] for k in ("id", "path", "method", "query", "status_code", "started_at", "duration_ms")})
+    return reports
+
+_sql_hooks_installed = False
+
+def _install_sql_hooks():
+    # Installed on first use, so the default path never pays for them.
+    global _sql_hooks_installed
+    if _sql_hooks_installed:
+        return
+    _sql_hooks_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = current.get()
+        if profile is not None and conn.info.get("profile_started"):
+            profile.add_statement(statement, time.perf_counter() - conn.info["profile_started"].pop())
+
+def _is_admin(request: Request) -> bool:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("role") == "admin"
+
+def requested(request: Request) -> bool:
+    flagged = request.headers.get(PROFILE_HEADER) == "1" or request.query_params.get(PROFILE_QUERY) == "1"
+    return flagged and _is_admin(request)
+
+# Only one profile is captured at a time: a profiler enabled on the event
+# loop would record every request interleaved there, and Python 3.12 refuses
+# to start a second profiler while one is active.
+_capturing = threading.Lock()
+
+async def handle(request: Request, call_next):
+    if not requested(request):
+        return await call_next(request)
+    if not _capturing.acquire(blocking=False):
+        return JSONResponse({"detail": "Another request is being profiled, retry shortly"}, status_code=409)
+
+    try:
+        _install_sql_hooks()
+        profile = Profile(request)
+        token = current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            current.reset(token)
+        _save(profile, profile.report(response.status_code, time.perf_counter() - started))
+    finally:
+        _capturing.release()
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+# The middleware only marks the request; the single profiler runs around
+# the endpoint in the worker thread that executes it.
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _profiled(endpoint):
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = current.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        profile.profiler = cProfile.Profile()
+        profile.profiler.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.profiler.disable()
+    return wrapper
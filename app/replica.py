@@ -0,0 +1,170 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+import structlog
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, delete, insert, inspect, select
+
+from . import models, shared_state, changes
+from .config import settings
+from .database import SessionLocal, ReadSessionLocal, replica_engine
+
+logger = structlog.get_logger(__name__)
+
+BATCH_SIZE = 1000
+REPLICATED_TABLES = (models.Student.__table__, models.Event.__table__, models.Enrolment.__table__, models.Points.__table__)
+
+state_metadata = MetaData()
+replica_state = Table(
+    "replica_state", state_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("seq", Integer),
+    Column("refreshed_at", Float),
+    Column("primary_hash", String),
+)
+
+# Only a digest of the primary URL is kept in the replica file; the URL
+# itself can carry credentials such as a sqlitecloud API key.
+def _primary_hash() -> str:
+    return hashlib.sha256(settings.DATABASE_URL.encode()).hexdigest()
+
+def _upsert(conn, table, rows):
+    if rows:
+        conn.execute(insert(table).prefix_with("OR REPLACE"), [dict(r._mapping) for r in rows])
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._prepared = False
+
+    def _prepare(self):
+        if not self._prepared:
+            # Rebuild from scratch when the primary schema has moved on.
+            existing = inspect(self.engine)
+            if any(
+                existing.has_table(table.name) and {c["name"] for c in existing.get_columns(table.name)} != set(table.columns.keys())
+                for table in (*REPLICATED_TABLES, replica_state)
+            ):
+                for table in reversed(REPLICATED_TABLES):
+                    table.drop(self.engine, checkfirst=True)
+                replica_state.drop(self.engine, checkfirst=True)
+                # Reclaim the dropped pages, which may still hold an old
+                # plain-text primary URL.
+                with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.exec_driver_sql("VACUUM")
+            for table in REPLICATED_TABLES:
+                table.create(self.engine, checkfirst=True)
+            replica_state.create(self.engine, checkfirst=True)
+            self._prepared = True
+
+    def _state(self, conn):
+        return conn.execute(select(replica_state).where(replica_state.c.id == 1)).first()
+
+    def ensure_fresh(self, max_staleness: float):
+        if time.time() - self._checked_at <= max_staleness:
+            return
+        with self._lock:
+            if time.time() - self._checked_at <= max_staleness:
+                return
+            self._prepare()
+            with self.engine.connect() as conn:
+                row = self._state(conn)
+            if row is None or time.time() - row.refreshed_at > max_staleness:
+                self.refresh()
+            else:
+                self._checked_at = row.refreshed_at
+
+    def refresh(self):
+        self._prepare()
+        # Serialise refreshes across workers sharing the replica file.
+        lock_path = os.path.join(shared_state.state.directory, "replica.lock")
+        os.makedirs(shared_state.state.directory, exist_ok=True)
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            started = time.time()
+            primary = SessionLocal()
+            try:
+                with self.engine.begin() as conn:
+                    row = self._state(conn)
+                    if row is None or row.primary_hash != _primary_hash():
+                        seq = self._full_copy(primary, conn)
+                    else:
+                        seq = self._apply_changes(primary, conn, row.seq)
+                    conn.execute(delete(replica_state))
+                    conn.execute(insert(replica_state).values(id=1, seq=seq, refreshed_at=started, primary_hash=_primary_hash()))
+            finally:
+                primary.close()
+            self._checked_at = started
+            logger.info("replica refreshed", seq=seq, duration_ms=round((time.time() - started) * 1000, 1))
+
+    def _full_copy(self, primary, conn):
+        seq = primary.query(models.ChangeLog.seq).order_by(models.ChangeLog.seq.desc()).limit(1).scalar() or 0
+        for table in reversed(REPLICATED_TABLES):
+            conn.execute(delete(table))
+        for table in REPLICATED_TABLES:
+            result = primary.execute(select(table)).yield_per(BATCH_SIZE)
+            for rows in result.partitions():
+                _upsert(conn, table, rows)
+        return seq
+
+    def _apply_changes(self, primary, conn, since: int):
+        students = models.Student.__table__
+        points = models.Points.__table__
+        event_table = models.Event.__table__
+        enrolments = models.Enrolment.__table__
+        while True:
+            log = primary.query(models.ChangeLog.seq, models.ChangeLog.entity, models.ChangeLog.entity_id, models.ChangeLog.op) \
+                .filter(models.ChangeLog.seq > since) \
+                .order_by(models.ChangeLog.seq) \
+                .limit(BATCH_SIZE) \
+                .all()
+            if not log:
+                return since
+
+            latest = {}
+            for _, entity, entity_id, op in log:
+                latest[(entity, entity_id)] = op
+            student_ids = {i: op for (e, i), op in latest.items() if e == changes.STUDENT}
+            points_ids = {int(i): op for (e, i), op in latest.items() if e == changes.POINTS}
+            event_ids = {int(i): op for (e, i), op in latest.items() if e == changes.EVENT}
+            enrolment_keys = [tuple(i.split(":", 1)) for (e, i), op in latest.items() if e == changes.ENROLMENT]
+
+            archived_events = [i for i, op in event_ids.items() if op == changes.ARCHIVE]
+            if archived_events:
+                conn.execute(delete(points).where(points.c.event_id.in_(archived_events)))
+                conn.execute(delete(enrolments).where(enrolments.c.event_id.in_(archived_events)))
+            if event_ids:
+                _upsert(conn, event_table, primary.execute(select(event_table).where(event_table.c.id.in_(event_ids))).all())
+
+            deleted_students = [i for i, op in student_ids.items() if op == changes.DELETE]
+            if deleted_students:
+                conn.execute(delete(points).where(points.c.student_id.in_(deleted_students)))
+                conn.execute(delete(enrolments).where(enrolments.c.student_id.in_(deleted_students)))
+                conn.execute(delete(students).where(students.c.id.in_(deleted_students)))
+            deleted_points = [i for i, op in points_ids.items() if op == changes.DELETE]
+            if deleted_points:
+                conn.execute(delete(points).where(points.c.id.in_(deleted_points)))
+
+            upserted_students = [i for i, op in student_ids.items() if op == changes.UPSERT]
+            if upserted_students:
+                _upsert(conn, students, primary.execute(select(students).where(students.c.id.in_(upserted_students))).all())
+            upserted_points = [i for i, op in points_ids.items() if op == changes.UPSERT]
+            if upserted_points:
+                _upsert(conn, points, primary.execute(select(points).where(points.c.id.in_(upserted_points))).all())
+            for event_id, student_id in enrolment_keys:
+                _upsert(conn, enrolments, primary.execute(select(enrolments).where(
+                    enrolments.c.event_id == int(event_id), enrolments.c.student_id == student_id
+                )).all())
+
+            since = log[-1].seq
+
+replica = Replica(replica_engine) if replica_engine is not None else None
+
+def read_session(max_staleness: float = None):
+    if replica is not None:
+        replica.ensure_fresh(settings.REPLICA_MAX_STALENESS if max_staleness is None else max_staleness)
+    return ReadSessionLocal()
@@ -0,0 +1,9 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+# orjson encodes dicts, lists, dates and NumPy scalars natively and several
+# times faster than json.dumps. Routes that return one directly skip
+# response_model validation, so they must build rows in the documented shape.
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
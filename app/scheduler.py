@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import structlog
+
+from . import crud, shared_state, replica, events, audit
+from .config import settings
+from .database import site_session, site_of
+
+logger = structlog.get_logger(__name__)
+
+SNAPSHOTS = {
+    "event_predictions": crud.get_event_predictions,
+    "performance": crud.get_performance_analysis,
+    "performance_classes": crud.get_class_performance_comparison,
+}
+
+def _writes_since(snapshot, site: str = None) -> int:
+    return sum(shared_state.state.generations(site=site)) - sum(snapshot["generation"][:len(shared_state.TOPICS)])
+
+def _is_current(snapshot) -> bool:
+    # Computed today, against the generation topics this build counts.
+    return snapshot is not None and len(snapshot["generation"]) == len(shared_state.TOPICS) + 1 \
+        and snapshot["generation"][-1] == date.today().isoformat()
+
+def _is_due(snapshot, site: str = None) -> bool:
+    if not _is_current(snapshot):
+        return True
+    writes = _writes_since(snapshot, site)
+    return (time.time() - snapshot["computed_at"] >= settings.STATS_REFRESH_INTERVAL and writes > 0) \
+        or writes >= settings.STATS_REFRESH_AFTER_WRITES
+
+def snapshot_name(name: str, event_id: int = None, site: str = None) -> str:
+    name = f"{name}.event-{event_id}" if event_id else name
+    return f"site-{site}.{name}" if site else name
+
+def refresh(name: str, db=None, event_id: int = None):
+    own_session = db is None
+    db = db or replica.read_session()
+    try:
+        generation = shared_state.state.generations(site=site_of(db)) + (date.today().isoformat(),)
+        return shared_state.state.write_snapshot(snapshot_name(name, event_id, site_of(db)), SNAPSHOTS[name](db, event_id), generation)
+    finally:
+        if own_session:
+            db.close()
+
+def get_snapshot(name: str, db, fresh: bool = False, event_id: int = None):
+    snapshot = shared_state.state.read_snapshot(snapshot_name(name, event_id, site_of(db)))
+    if fresh or not _is_current(snapshot) \
+            or time.time() - snapshot["computed_at"] > settings.STATS_MAX_STALENESS:
+        snapshot = refresh(name, db, event_id)
+    return snapshot
+
+def snapshot_metadata(snapshot, site: str = None) -> dict:
+    return {
+        "computed_at": datetime.fromtimestamp(snapshot["computed_at"], tz=timezone.utc).isoformat(),
+        "staleness_seconds": round(time.time() - snapshot["computed_at"], 1),
+        "writes_since_computed": max(_writes_since(snapshot, site), 0),
+    }
+
+class StatsScheduler:
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_retention = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stats-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("stats snapshot refresh failed")
+            try:
+                self.run_retention()
+            except Exception:
+                logger.exception("audit log retention failed")
+
+    def run_retention(self):
+        if settings.AUDIT_RETENTION_DAYS <= 0 or time.time() - self._last_retention < settings.AUDIT_RETENTION_INTERVAL:
+            return
+        self._last_retention = time.time()
+        with shared_state.state.try_lock("audit-retention") as leader:
+            if not leader:
+                return
+            for site in [None, *settings.SITES]:
+                db = site_session(site)
+                try:
+                    audit.archive_old_logs(db)
+                finally:
+                    db.close()
+
+    def run_pending(self):
+        for site in [None, *settings.SITES]:
+            try:
+                self._refresh_site(site)
+            except Exception:
+                logger.exception("stats snapshot refresh failed", site=site)
+
+    def _refresh_site(self, site: str = None):
+        # The local replica only follows the primary database.
+        db = site_session(site) if site else replica.read_session()
+        try:
+            event_id = events.calendar.current_event_id(db)
+            due = [name for name in SNAPSHOTS if _is_due(shared_state.state.read_snapshot(snapshot_name(name, event_id, site)), site)]
+            if not due:
+                return
+            # Only one worker on the box recomputes; the others pick up its files.
+            with shared_state.state.try_lock("stats-scheduler") as leader:
+                if not leader:
+                    return
+                for name in due:
+                    started = time.perf_counter()
+                    refresh(name, db, event_id)
+                    logger.info("stats snapshot refreshed", snapshot=snapshot_name(name, event_id, site), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        finally:
+            db.close()
+
+scheduler = StatsScheduler()
@@ -1,8 +1,20 @@
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional
-from datetime import date, datetime
-from . import crud
-from .dependencies import get_db
+from pydantic import BaseModel, Field, validator, root_validator
+from typing import Dict, List, Optional
+from datetime import date, datetime, timezone
+import html
+import bleach
+
+def clean_string(value: str) -> str:
+    # Disallowed tags are removed rather than escaped, and entities are
+    # decoded, so plain text such as "Tom & Jerry" is stored as typed.
+    return html.unescape(bleach.clean(value, strip=True))
+
+def clean_strings(cls, values):
+    # Runs before field validation, so each string is cleaned and validated
+    # in the same parse.
+    if isinstance(values, dict):
+        return {key: clean_string(value) if isinstance(value, str) else value for key, value in values.items()}
+    return values
 
 class StudentBase(BaseModel):
     name: str = Field(..., min_length=2, max_length=50)
@@ -19,13 +31,9 @@ class StudentBase(BaseModel):
             raise ValueError('gender must be male, female, or other')
         return v.lower()
 
+# Only request bodies are cleaned; responses built from stored rows skip it.
 class StudentCreate(StudentBase):
-    @validator('name')
-    def name_must_not_be_duplicate(cls, v):
-        db = next(get_db())
-        if crud.get_student_by_name(db, name=v):
-            raise ValueError('Student with this name already exists')
-        return v
+    sanitize_strings = root_validator(pre=True, allow_reuse=True)(clean_strings)
 
 class StudentUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=2, max_length=50)
@@ -36,6 +44,8 @@ class StudentUpdate(BaseModel):
     parent_phone: Optional[str] = None
     notes: Optional[str] = Field(None, max_length=500)
 
+    sanitize_strings = root_validator(pre=True, allow_reuse=True)(clean_strings)
+
     @validator('gender')
     def gender_must_be_valid(cls, v):
         if v is not None and v.lower() not in ['male', 'female', 'other']:
@@ -74,6 +84,48 @@ class PointAdjustment(BaseModel):
     date_adjust: date = Field(default_factory=date.today)
 
 
+class SyncOperation(BaseModel):
+    idempotency_key: str = Field(..., min_length=1, max_length=100)
+    type: str
+    timestamp: datetime
+    student_id: str
+    award: Optional[PointsCreate] = None
+    adjustment: Optional[PointAdjustment] = None
+    update: Optional[StudentUpdate] = None
+
+    @validator('timestamp')
+    def timestamp_in_utc(cls, v):
+        # Naive client timestamps are taken to be UTC, so a batch always
+        # orders and compares on one clock.
+        return v.astimezone(timezone.utc) if v.tzinfo else v.replace(tzinfo=timezone.utc)
+
+    @root_validator(skip_on_failure=True)
+    def payload_must_match_type(cls, values):
+        payload_field = {"award": "award", "adjust": "adjustment", "update_student": "update"}.get(values.get("type"))
+        if payload_field is None:
+            raise ValueError('type must be award, adjust, or update_student')
+        if values.get(payload_field) is None:
+            raise ValueError(f'{payload_field} is required for {values["type"]} operations')
+        return values
+
+class SyncBatch(BaseModel):
+    operations: List[SyncOperation]
+
+    @validator('operations')
+    def batch_must_be_bounded(cls, v):
+        if len(v) > 500:
+            raise ValueError('a sync batch may contain at most 500 operations')
+        return v
+
+class SyncOperationResult(BaseModel):
+    idempotency_key: str
+    student_id: str
+    status: str
+    detail: Optional[str] = None
+
+class SyncResponse(BaseModel):
+    results: List[SyncOperationResult]
+
 class StudentResponse(StudentBase):
     id: str
     group: str
@@ -83,22 +135,105 @@ class StudentResponse(StudentBase):
     class Config:
         orm_mode = True
 
+class PointsCategorySummary(BaseModel):
+    times_awarded: int
+    points: int
+
+class PointsSummary(BaseModel):
+    days_recorded: int
+    total: int
+    categories: Dict[str, PointsCategorySummary]
+
 class StudentDetailResponse(StudentResponse):
     points_records: List[PointsResponse] = []
+    points_summary: Optional[PointsSummary] = None
     
     class Config:
         orm_mode = True
 
+class StudentSearchResult(BaseModel):
+    id: str
+    name: str
+    group: Optional[str] = None
+    parent_name: Optional[str] = None
+    parent_phone: Optional[str] = None
+    score: float
+
+class CheckinRosterEntry(BaseModel):
+    code: str
+    student_id: str
+    name: str
+    group: Optional[str] = None
+
+class CheckinResponse(BaseModel):
+    student_id: str
+    name: str
+    group: Optional[str] = None
+    award_date: date
+    status: str
+
+class PointsChange(PointsResponse):
+    student_id: str
+    event_id: Optional[int] = None
+
+class ChangesResponse(BaseModel):
+    since: int
+    next_since: int
+    has_more: bool
+    students: List[StudentResponse] = []
+    deleted_students: List[str] = []
+    points: List[PointsChange] = []
+    deleted_points: List[int] = []
+    archived_events: List[int] = []
+
+class EventCreate(BaseModel):
+    name: str = Field(..., min_length=2, max_length=100)
+    start_date: date
+    end_date: date
+
+    @validator('end_date')
+    def end_must_not_precede_start(cls, v, values):
+        if 'start_date' in values and v < values['start_date']:
+            raise ValueError('end_date must not be before start_date')
+        return v
+
+class Event(BaseModel):
+    id: int
+    name: str
+    start_date: date
+    end_date: date
+    status: str
+    archive_path: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class AuditLogEntry(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    action: Optional[str] = None
+    details: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogEntry]
+    next_before: Optional[int] = None
+
 class UserBase(BaseModel):
     username: str
 
 class UserCreate(UserBase):
     password: str
     role: str = "viewer"
+    site: Optional[str] = None
 
 class User(UserBase):
     id: int
     role: str
+    site: Optional[str] = None
 
     class Config:
         orm_mode = True
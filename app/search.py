@@ -0,0 +1,180 @@
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from sqlalchemy.orm import Session
+
+from . import models, shared_state
+from .database import site_of
+
+NAME_WEIGHT = 1.0
+PARENT_WEIGHT = 0.6
+PHONE_WEIGHT = 0.8
+MIN_SIMILARITY = 0.45
+MAX_CANDIDATES = 200
+COMMON_GRAM_RATIO = 0.05
+
+def normalize(text: str) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r"[^a-z0-9]+", " ", text.casefold()).strip()
+
+def digits(text: str) -> str:
+    return re.sub(r"\D", "", text or "")
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if b.startswith(a):
+        return 0.9
+    ga, gb = trigrams(a), trigrams(b)
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+def _field_score(query_tokens: list, field_tokens: list) -> float:
+    if not field_tokens:
+        return 0.0
+    score = 0.0
+    for q in query_tokens:
+        best = max(similarity(q, t) for t in field_tokens)
+        if best < MIN_SIMILARITY:
+            return 0.0
+        score += best
+    return score / len(query_tokens)
+
+class StudentSearchIndex:
+    def __init__(self, site: str = None):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._docs = {}
+        self._postings = defaultdict(set)
+        self._phone_postings = defaultdict(set)
+        self._watcher = shared_state.Watcher(shared_state.ROSTER, site)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db: Session):
+        generation = self._watcher.current()
+        rows = db.query(
+            models.Student.id, models.Student.name, models.Student.group,
+            models.Student.parent_name, models.Student.parent_phone
+        ).all()
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._phone_postings.clear()
+            for row in rows:
+                self._add(*row)
+            self._watcher.seen = generation
+            self._loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self._loaded or self._watcher.is_stale():
+            self.load(db)
+
+    def upsert(self, student: models.Student):
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(student.id)
+            self._add(student.id, student.name, student.group, student.parent_name, student.parent_phone)
+            self._watcher.advance()
+
+    def remove(self, student_id: str):
+        with self._lock:
+            if self._loaded:
+                self._remove(student_id)
+                self._watcher.advance()
+
+    def _add(self, student_id, name, group, parent_name, parent_phone):
+        name_tokens = normalize(name).split()
+        parent_tokens = normalize(parent_name).split()
+        phone = digits(parent_phone)
+        grams = set()
+        for token in name_tokens + parent_tokens:
+            grams |= trigrams(token)
+        phone_grams = {phone[i:i + 3] for i in range(len(phone) - 2)}
+
+        self._docs[student_id] = {
+            "id": student_id,
+            "name": name,
+            "group": group,
+            "parent_name": parent_name,
+            "parent_phone": parent_phone,
+            "name_tokens": name_tokens,
+            "parent_tokens": parent_tokens,
+            "phone": phone,
+            "grams": grams,
+            "phone_grams": phone_grams,
+        }
+        for gram in grams:
+            self._postings[gram].add(student_id)
+        for gram in phone_grams:
+            self._phone_postings[gram].add(student_id)
+
+    def _remove(self, student_id):
+        doc = self._docs.pop(student_id, None)
+        if not doc:
+            return
+        for gram in doc["grams"]:
+            self._postings[gram].discard(student_id)
+        for gram in doc["phone_grams"]:
+            self._phone_postings[gram].discard(student_id)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        query_tokens = normalize(query).split()
+        query_phone = digits(query)
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(gram, ()) for token in query_tokens for gram in trigrams(token)]
+            if len(query_phone) >= 3:
+                postings += [self._phone_postings.get(query_phone[i:i + 3], ()) for i in range(len(query_phone) - 2)]
+
+            # Very common grams (e.g. a leading "  a") add little signal but
+            # dominate counting cost, so skip them when rarer grams exist.
+            common = max(len(self._docs) * COMMON_GRAM_RATIO, MAX_CANDIDATES)
+            selective = [p for p in postings if 0 < len(p) <= common]
+            counts = Counter()
+            for posting in selective or postings:
+                counts.update(posting)
+
+            results = []
+            for student_id, _ in counts.most_common(MAX_CANDIDATES):
+                doc = self._docs[student_id]
+                score = max(
+                    NAME_WEIGHT * _field_score(query_tokens, doc["name_tokens"]),
+                    PARENT_WEIGHT * _field_score(query_tokens, doc["parent_tokens"]),
+                    PHONE_WEIGHT if len(query_phone) >= 3 and query_phone in doc["phone"] else 0.0,
+                )
+                if score > 0:
+                    results.append((score, doc))
+
+        results.sort(key=lambda r: (-r[0], r[1]["name"] or ""))
+        return [{
+            "id": doc["id"],
+            "name": doc["name"],
+            "group": doc["group"],
+            "parent_name": doc["parent_name"],
+            "parent_phone": doc["parent_phone"],
+            "score": round(score, 3),
+        } for score, doc in results[:limit]]
+
+indexes = {}
+_indexes_lock = threading.Lock()
+
+def index_for(db: Session) -> StudentSearchIndex:
+    site = site_of(db)
+    with _indexes_lock:
+        if site not in indexes:
+            indexes[site] = StudentSearchIndex(site)
+        return indexes[site]
@@ -0,0 +1,132 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+
+from .config import settings
+
+ROSTER = "roster"
+POINTS = "points"
+EVENTS = "events"
+TOPICS = (ROSTER, POINTS, EVENTS)
+# Every site counts its own writes, so one site's check-ins never
+# invalidate another site's caches.
+SITES = (None, *settings.SITES)
+
+_SLOT = struct.Struct("<Q")
+
+def _default_dir() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "ebf-api")
+
+# Generation counters and snapshots shared by every worker on the box.
+# Counters live in a small memory-mapped file so reading one is a plain
+# memory access; writers serialise on an flock. Snapshots are JSON files
+# replaced atomically, so readers never see a partial write.
+class SharedState:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._mmap = None
+        self._fd = None
+        self._pid = None
+
+    def _counters(self):
+        # Re-open after fork so each worker owns its descriptor.
+        if self._mmap is None or self._pid != os.getpid():
+            os.makedirs(os.path.join(self.directory, "snapshots"), exist_ok=True)
+            path = os.path.join(self.directory, "generations")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = _SLOT.size * len(TOPICS) * len(SITES)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._mmap, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+        return self._mmap
+
+    def _offset(self, topic: str, site: str = None) -> int:
+        return (SITES.index(site) * len(TOPICS) + TOPICS.index(topic)) * _SLOT.size
+
+    def generation(self, topic: str, site: str = None) -> int:
+        return _SLOT.unpack_from(self._counters(), self._offset(topic, site))[0]
+
+    def generations(self, topics=TOPICS, site: str = None) -> tuple:
+        return tuple(self.generation(t, site) for t in topics)
+
+    def bump(self, topic: str, site: str = None) -> int:
+        counters = self._counters()
+        offset = self._offset(topic, site)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            value = _SLOT.unpack_from(counters, offset)[0] + 1
+            _SLOT.pack_into(counters, offset, value)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return value
+
+    @contextmanager
+    def try_lock(self, name: str):
+        self._counters()
+        fd = os.open(os.path.join(self.directory, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _snapshot_path(self, name: str) -> str:
+        self._counters()
+        return os.path.join(self.directory, "snapshots", f"{name}.json")
+
+    def read_snapshot(self, name: str):
+        try:
+            with open(self._snapshot_path(name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_snapshot(self, name: str, data, generation: tuple):
+        snapshot = {"computed_at": time.time(), "generation": list(generation), "data": data}
+        path = self._snapshot_path(name)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(tmp_path, path)
+        return snapshot
+
+    def cached(self, name: str, compute, topics=TOPICS, key: tuple = (), site: str = None):
+        generation = self.generations(topics, site) + tuple(key)
+        snapshot = self.read_snapshot(name)
+        if snapshot is not None and tuple(snapshot["generation"]) == generation \
+                and time.time() - snapshot["computed_at"] <= settings.STATS_MAX_STALENESS:
+            return snapshot["data"]
+        return self.write_snapshot(name, compute(), generation)["data"]
+
+class Watcher:
+    def __init__(self, topic: str, site: str = None):
+        self.topic = topic
+        self.site = site
+        self.seen = None
+
+    def current(self) -> int:
+        return state.generation(self.topic, self.site)
+
+    def is_stale(self) -> bool:
+        return self.seen != self.current()
+
+    def advance(self):
+        # Only adopt the new generation if the single bump since we last
+        # synced was our own write; otherwise another worker changed data.
+        if self.seen is not None and self.current() == self.seen + 1:
+            self.seen += 1
+
+state = SharedState(settings.SHARED_STATE_DIR or _default_dir())
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date
+
+import structlog
+
+from . import crud, events, replica
+from .config import settings
+from .database import site_session
+
+logger = structlog.get_logger(__name__)
+
+PRIMARY = "primary"
+
+def site_names() -> list:
+    return [None, *settings.SITES]
+
+def _read_session(site: str = None):
+    return site_session(site) if site else replica.read_session()
+
+def site_totals(site: str = None) -> dict:
+    db = _read_session(site)
+    try:
+        event_id = events.calendar.current_event_id(db)
+        return {
+            "site": site or PRIMARY,
+            "event_id": event_id,
+            "total_registered": crud.count_students(db, event_id),
+            "total_points_awarded": crud.get_total_points_awarded(db, event_id) or 0,
+            "present_today": crud.get_daily_attendance(db, date.today(), event_id) or 0,
+        }
+    finally:
+        db.close()
+
+# Every site is queried at once on its own connection, so the answer takes
+# as long as the slowest site rather than the sum of all of them. A site
+# that fails or times out is reported and left out of the totals.
+def cross_site_totals() -> dict:
+    names = site_names()
+    executor = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="site-totals")
+    try:
+        futures = {executor.submit(site_totals, site): site or PRIMARY for site in names}
+        done, _ = wait(futures, timeout=settings.SITE_QUERY_TIMEOUT)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    sites, unavailable = [], []
+    for future, site in futures.items():
+        if future in done and future.exception() is None:
+            sites.append(future.result())
+        else:
+            if future in done:
+                logger.warning("site totals failed", site=site, error=str(future.exception()))
+            unavailable.append(site)
+    return {
+        "sites": sites,
+        "unavailable": unavailable,
+        "total_registered": sum(s["total_registered"] for s in sites),
+        "total_points_awarded": sum(s["total_points_awarded"] for s in sites),
+        "present_today": sum(s["present_today"] for s in sites),
+    }
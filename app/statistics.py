@@ -1,47 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date, timedelta
 
-from . import crud, models, schemas, dependencies
-
-router = APIRouter()
-
-def get_event_dates():
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    end_of_week = start_of_week + timedelta(days=4)
-    return start_of_week, end_of_week
+from . import crud, models, schemas, dependencies, shared_state, scheduler, engagement, events, profiler, database, sites, admission
+from .config import settings
+from .responses import FastJSONResponse
+
+router = APIRouter(route_class=profiler.ProfiledRoute, default_response_class=FastJSONResponse)
+
+def cached_stats(name: str, compute, site: str = None):
+    return shared_state.state.cached(name, compute, key=(date.today().isoformat(),), site=site)
+
+def snapshot_stats(name: str, db: Session, fresh: bool, response: Response, event: models.Event = None):
+    snapshot = scheduler.get_snapshot(name, db, fresh=fresh, event_id=scope(event))
+    metadata = scheduler.snapshot_metadata(snapshot, database.site_of(db))
+    response.headers["X-Computed-At"] = metadata["computed_at"]
+    response.headers["X-Staleness-Seconds"] = str(metadata["staleness_seconds"])
+    data = snapshot["data"]
+    if isinstance(data, dict):
+        return {**data, **metadata}
+    return data
+
+def get_event(event_id: Optional[int] = None, db: Session = Depends(dependencies.get_read_db)):
+    if event_id is None:
+        event_id = events.calendar.current_event_id(db)
+        if event_id is None:
+            return None
+    event = db.get(models.Event, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.status == events.ARCHIVED:
+        raise HTTPException(status_code=409, detail=f"Event is archived, see /events/{event.id}/archive/summary")
+    return event
+
+def scope(event: models.Event = None):
+    return event.id if event else None
+
+def get_event_dates(event: models.Event = None):
+    return events.event_dates(event)
 
 @router.get("/event/summary", summary="Get event summary")
-def get_event_summary(db: Session = Depends(dependencies.get_db)):
-    start_date, end_date = get_event_dates()
-    total_students = db.query(models.Student).count()
+def get_event_summary(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    start_date, end_date = get_event_dates(event)
+    total_days = (end_date - start_date).days + 1
+    total_students = crud.count_students(db, scope(event))
+    days_completed = min(events.days_elapsed(event), total_days)
     
     return {
-        "event_name": "Escola Biblica de Ferias 2025",
+        "event_id": scope(event),
+        "event_name": event.name if event else settings.DEFAULT_EVENT_NAME,
         "start_date": start_date.isoformat(),
         "end_date": end_date.isoformat(),
-        "current_day": (date.today() - start_date).days + 1,
-        "total_days": 5,
+        "current_day": days_completed,
+        "total_days": total_days,
         "total_registered": total_students,
-        "average_daily_attendance": crud.get_average_daily_attendance(db, start_date, end_date),
-        "total_points_awarded": crud.get_total_points_awarded(db),
-        "completion_percentage": round(((date.today() - start_date).days + 1) / 5 * 100, 1)
+        "average_daily_attendance": crud.get_average_daily_attendance(db, start_date, end_date, scope(event)),
+        "total_points_awarded": crud.get_total_points_awarded(db, scope(event)),
+        "completion_percentage": round(days_completed / total_days * 100, 1)
     }
 
 @router.get("/event/progress", summary="Get event progress")
-def get_event_progress(db: Session = Depends(dependencies.get_db)):
-    start_date, end_date = get_event_dates()
-    days_completed = (date.today() - start_date).days + 1
+def get_event_progress(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    start_date, end_date = get_event_dates(event)
+    total_days = (end_date - start_date).days + 1
+    days_completed = min(events.days_elapsed(event), total_days)
     
     milestones = {}
-    for i in range(7):
+    for i in range(total_days if event else 7):
         day = start_date + timedelta(days=i)
         if day <= date.today():
             status = "completed"
-            attendance = crud.get_daily_attendance(db, day)
-            points = crud.get_daily_points(db, day)
+            attendance = crud.get_daily_attendance(db, day, scope(event))
+            points = crud.get_daily_points(db, day, scope(event))
             milestones[f"day_{i+1}"] = {"status": status, "attendance": attendance, "points": points}
         else:
             status = "upcoming"
@@ -49,70 +80,109 @@ def get_event_progress(db: Session = Depends(dependencies.get_db)):
 
     return {
         "days_completed": days_completed,
-        "days_remaining": 5 - days_completed,
-        "overall_progress": round(days_completed / 5 * 100, 1),
+        "days_remaining": total_days - days_completed,
+        "overall_progress": round(days_completed / total_days * 100, 1),
         "milestones": milestones
     }
 
 @router.get("/attendance/daily", summary="Get daily attendance")
-def get_daily_attendance_stats(day: Optional[int] = None, class_id: Optional[str] = None, db: Session = Depends(dependencies.get_db)):
-    start_date, _ = get_event_dates()
+def get_daily_attendance_stats(day: Optional[int] = None, class_id: Optional[str] = None, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    start_date, _ = get_event_dates(event)
     
     if day:
         target_date = start_date + timedelta(days=day-1)
     else:
         target_date = date.today()
         
-    return crud.get_daily_attendance_stats(db, target_date, class_id)
+    return crud.get_daily_attendance_stats(db, target_date, class_id, scope(event))
 
 @router.get("/today/detailed", summary="Get detailed stats for today")
-def get_today_detailed_stats(db: Session = Depends(dependencies.get_db)):
-    return crud.get_detailed_today_stats(db)
+def get_today_detailed_stats(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_detailed_today_stats(db, scope(event))
 
 @router.get("/registrations", summary="Get registration statistics")
-def get_registration_stats(db: Session = Depends(dependencies.get_db)):
-    return crud.get_registration_statistics(db)
+def get_registration_stats(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_registration_statistics(db, scope(event))
 
 @router.get("/registrations/demographics", summary="Get registration demographics")
-def get_registration_demographics(db: Session = Depends(dependencies.get_db)):
-    return crud.get_registration_demographics(db)
+def get_registration_demographics(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_registration_demographics(db, scope(event))
 
 @router.get("/today/summary", summary="Get summary for today")
-def get_today_summary(db: Session = Depends(dependencies.get_db)):
-    return crud.get_today_summary(db)
+def get_today_summary(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_today_summary(db, scope(event))
 
 @router.get("/today/students", summary="Get students present today")
-def get_students_present_today(db: Session = Depends(dependencies.get_db)):
-    return crud.get_students_present_today(db)
+def get_students_present_today(db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return FastJSONResponse(crud.get_students_present_today(db, scope(event)))
 
 @router.get("/engagement", summary="Get event engagement")
-def get_event_engagement(day: Optional[str] = 'overall', class_id: Optional[str] = None, gender: Optional[str] = None, db: Session = Depends(dependencies.get_db)):
-    return crud.get_event_engagement(db, day, class_id, gender)
+def get_event_engagement(day: Optional[str] = 'overall', class_id: Optional[str] = None, gender: Optional[str] = None, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_event_engagement(db, day, class_id, gender, scope(event))
+
+@router.get("/breakdown", summary="Get engagement and performance by dimension")
+def get_engagement_breakdown(by: str = "class", class_id: Optional[str] = None, gender: Optional[str] = None, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    dimensions = [d.strip() for d in by.split(",") if d.strip()]
+    try:
+        return engagement.breakdown(db, by=dimensions, class_id=class_id, gender=gender, event_id=scope(event))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/performance/rankings", summary="Get student performance rankings")
-def get_performance_rankings(class_id: Optional[str] = None, gender: Optional[str] = None, day: Optional[str] = 'overall', limit: int = 10, db: Session = Depends(dependencies.get_db)):
-    return crud.get_student_performance_rankings(db, class_id, gender, day, limit)
+def get_performance_rankings(class_id: Optional[str] = None, gender: Optional[str] = None, day: Optional[str] = 'overall', limit: int = 10, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_student_performance_rankings(db, class_id, gender, day, limit, scope(event))
 
 @router.get("/performance/classes", summary="Get class performance comparison")
-def get_class_performance_comparison(db: Session = Depends(dependencies.get_db)):
-    return crud.get_class_performance_comparison(db)
+def get_class_performance_comparison(response: Response, fresh: bool = False, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return snapshot_stats("performance_classes", db, fresh, response, event)
 
 @router.get("/points/summary", summary="Get points summary by category")
-def get_points_summary_by_category(day: Optional[str] = 'overall', class_id: Optional[str] = None, gender: Optional[str] = None, db: Session = Depends(dependencies.get_db)):
-    return crud.get_points_summary_by_category(db, day, class_id, gender)
+def get_points_summary_by_category(day: Optional[str] = 'overall', class_id: Optional[str] = None, gender: Optional[str] = None, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_points_summary_by_category(db, day, class_id, gender, scope(event))
 
 @router.get("/points/daily", summary="Get daily points trends")
-def get_daily_points_trends(include_projections: bool = False, class_id: Optional[str] = None, db: Session = Depends(dependencies.get_db)):
-    return crud.get_daily_points_trends(db, include_projections, class_id)
+def get_daily_points_trends(include_projections: bool = False, class_id: Optional[str] = None, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return crud.get_daily_points_trends(db, include_projections, class_id, scope(event))
 
 @router.get("/points/distribution", summary="Get event points distribution")
-def get_event_points_distribution(db: Session = Depends(dependencies.get_db)):
-    return crud.get_event_points_distribution(db)
+def get_event_points_distribution(
+    bins: Optional[str] = None,
+    percentiles: Optional[str] = None,
+    by: Optional[str] = None,
+    class_id: Optional[str] = None,
+    gender: Optional[str] = None,
+    approximate: Optional[bool] = None,
+    db: Session = Depends(dependencies.get_read_db),
+    event: models.Event = Depends(get_event)
+):
+    try:
+        bin_edges = [int(b) for b in bins.split(",") if b.strip()] if bins else None
+        percentile_list = [float(p) for p in percentiles.split(",") if p.strip()] if percentiles else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bins and percentiles must be comma-separated numbers")
+    dimensions = [d.strip() for d in by.split(",") if d.strip()] if by else []
+    compute = lambda: crud.get_event_points_distribution(db, scope(event), bin_edges, percentile_list, dimensions, class_id, gender, approximate)
+    try:
+        if any([bins, percentiles, by, class_id, gender, approximate is not None]):
+            return compute()
+        # Only the default view is shared between workers.
+        site = database.site_of(db)
+        return cached_stats(scheduler.snapshot_name("points_distribution", scope(event), site), compute, site)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/performance", summary="Get performance analysis")
-def get_performance_analysis(db: Session = Depends(dependencies.get_db)):
-    return crud.get_performance_analysis(db)
+def get_performance_analysis(response: Response, fresh: bool = False, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return snapshot_stats("performance", db, fresh, response, event)
 
 @router.get("/event/predictions", summary="Get event predictions")
-def get_event_predictions(db: Session = Depends(dependencies.get_db)):
-    return crud.get_event_predictions(db)
\ No newline at end of file
+def get_event_predictions(response: Response, fresh: bool = False, db: Session = Depends(dependencies.get_read_db), event: models.Event = Depends(get_event)):
+    return snapshot_stats("event_predictions", db, fresh, response, event)
+
+@router.get("/sites", summary="Get totals across all sites")
+def get_cross_site_totals(current_user: models.User = Depends(dependencies.get_current_user)):
+    if current_user.role != "admin" or current_user.site:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return sites.cross_site_totals()
+
+admission.PER_CALLER.add("/stats/sites")
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import structlog
+
+from . import checkin, replica, scheduler, search
+from .config import settings
+from .database import SessionLocal, engine
+
+logger = structlog.get_logger(__name__)
+
+def warm_up():
+    started = time.perf_counter()
+    connections = [engine.connect() for _ in range(settings.POOL_PREWARM_CONNECTIONS)]
+    for connection in connections:
+        connection.close()
+
+    db = SessionLocal()
+    try:
+        search.index_for(db).load(db)
+        checkin.roster_for(db).load(db)
+    finally:
+        db.close()
+    if replica.replica is not None:
+        replica.replica.refresh()
+    if settings.STATS_SCHEDULER_ENABLED:
+        scheduler.scheduler.run_pending()
+    logger.info("warm-up finished", duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def _run():
+    try:
+        warm_up()
+    except Exception:
+        logger.exception("warm-up failed")
+
+def start_background_warmup():
+    threading.Thread(target=_run, name="warm-up", daemon=True).start()
@@ -1,4 +1,6 @@
 import uvicorn
 
+from app.config import settings
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, workers=settings.WORKERS, reload=settings.RELOAD)
@@ -0,0 +1,118 @@
+"""initial schema
+
+Databases created by the old import-time create_all() already have some
+of these tables, so each table is only created when it is missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def _missing(table: str) -> bool:
+    return table not in sa.inspect(op.get_bind()).get_table_names()
+
+def upgrade():
+    if _missing("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String()),
+            sa.Column("hashed_password", sa.String()),
+            sa.Column("role", sa.String()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    if _missing("students"):
+        op.create_table(
+            "students",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("age", sa.Integer()),
+            sa.Column("gender", sa.String()),
+            sa.Column("group", sa.String()),
+            sa.Column("address", sa.String(), nullable=True),
+            sa.Column("parent_name", sa.String()),
+            sa.Column("parent_phone", sa.String()),
+            sa.Column("notes", sa.String(), nullable=True),
+            sa.Column("total_points", sa.Integer()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("last_updated", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_students_name", "students", ["name"])
+
+    if _missing("points"):
+        op.create_table(
+            "points",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("student_id", sa.String(), sa.ForeignKey("students.id")),
+            sa.Column("award_date", sa.Date()),
+            sa.Column("presence", sa.Boolean()),
+            sa.Column("book", sa.Boolean()),
+            sa.Column("versicle", sa.Boolean()),
+            sa.Column("participation", sa.Boolean()),
+            sa.Column("guest", sa.Boolean()),
+            sa.Column("game", sa.Boolean()),
+            sa.Column("total", sa.Integer()),
+        )
+        op.create_index("ix_points_id", "points", ["id"])
+
+    if _missing("checkin_codes"):
+        op.create_table(
+            "checkin_codes",
+            sa.Column("code", sa.String(), primary_key=True),
+            sa.Column("student_id", sa.String(), sa.ForeignKey("students.id")),
+        )
+        op.create_index("ix_checkin_codes_student_id", "checkin_codes", ["student_id"], unique=True)
+
+    if _missing("audit_logs"):
+        op.create_table(
+            "audit_logs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("action", sa.String()),
+            sa.Column("details", sa.String()),
+            sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_audit_logs_id", "audit_logs", ["id"])
+
+    if _missing("sync_operations"):
+        op.create_table(
+            "sync_operations",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("idempotency_key", sa.String()),
+            sa.Column("operation", sa.String()),
+            sa.Column("student_id", sa.String()),
+            sa.Column("op_date", sa.Date(), nullable=True),
+            sa.Column("client_timestamp", sa.DateTime(timezone=True)),
+            sa.Column("status", sa.String()),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("applied_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_sync_operations_id", "sync_operations", ["id"])
+        op.create_index("ix_sync_operations_idempotency_key", "sync_operations", ["idempotency_key"], unique=True)
+        op.create_index("ix_sync_operations_lww", "sync_operations", ["operation", "student_id", "op_date", "client_timestamp"])
+
+    if _missing("change_log"):
+        op.create_table(
+            "change_log",
+            sa.Column("seq", sa.Integer(), primary_key=True),
+            sa.Column("entity", sa.String()),
+            sa.Column("entity_id", sa.String()),
+            sa.Column("op", sa.String()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sqlite_autoincrement=True,
+        )
+
+def downgrade():
+    for table in ("change_log", "sync_operations", "audit_logs", "checkin_codes", "points", "students", "users"):
+        op.drop_table(table)
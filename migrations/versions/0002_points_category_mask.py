@@ -0,0 +1,25 @@
+"""points category bitmask
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+CATEGORIES = ("presence", "book", "versicle", "participation", "guest", "game")
+
+def upgrade():
+    op.add_column("points", sa.Column("categories", sa.Integer(), nullable=False, server_default="0"))
+    mask = " + ".join(f"(CASE WHEN {name} THEN {1 << i} ELSE 0 END)" for i, name in enumerate(CATEGORIES))
+    op.execute(f"UPDATE points SET categories = {mask}")
+
+def downgrade():
+    with op.batch_alter_table("points") as batch_op:
+        batch_op.drop_column("categories")
@@ -0,0 +1,67 @@
+"""events, enrolments and points.event_id
+
+Existing points all belong to the season that was running before events
+existed, so they are assigned to a single backfilled event spanning their
+award dates, and every registered student is enrolled in it.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+BACKFILL_EVENT_NAME = "Escola Biblica de Ferias 2025"
+
+def upgrade():
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("start_date", sa.Date()),
+        sa.Column("end_date", sa.Date()),
+        sa.Column("status", sa.String()),
+        sa.Column("archive_path", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_events_id", "events", ["id"])
+
+    op.create_table(
+        "enrolments",
+        sa.Column("event_id", sa.Integer(), sa.ForeignKey("events.id"), primary_key=True),
+        sa.Column("student_id", sa.String(), sa.ForeignKey("students.id"), primary_key=True),
+    )
+    op.create_index("ix_enrolments_student_id", "enrolments", ["student_id"])
+
+    with op.batch_alter_table("points") as batch_op:
+        batch_op.add_column(sa.Column("event_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key("fk_points_event_id_events", "events", ["event_id"], ["id"])
+        batch_op.create_index("ix_points_event_id", ["event_id"])
+
+    bind = op.get_bind()
+    first, last = bind.execute(sa.text("SELECT MIN(award_date), MAX(award_date) FROM points")).one()
+    if first is None:
+        return
+    bind.execute(
+        sa.text("INSERT INTO events (name, start_date, end_date, status) VALUES (:name, :start, :end, 'active')"),
+        {"name": BACKFILL_EVENT_NAME, "start": first, "end": last},
+    )
+    event_id = bind.execute(sa.text("SELECT MAX(id) FROM events")).scalar()
+    bind.execute(sa.text("UPDATE points SET event_id = :event_id"), {"event_id": event_id})
+    bind.execute(sa.text("INSERT INTO enrolments (event_id, student_id) SELECT :event_id, id FROM students"), {"event_id": event_id})
+
+def downgrade():
+    with op.batch_alter_table("points") as batch_op:
+        batch_op.drop_index("ix_points_event_id")
+        batch_op.drop_constraint("fk_points_event_id_events", type_="foreignkey")
+        batch_op.drop_column("event_id")
+    op.drop_index("ix_enrolments_student_id", "enrolments")
+    op.drop_table("enrolments")
+    op.drop_index("ix_events_id", "events")
+    op.drop_table("events")
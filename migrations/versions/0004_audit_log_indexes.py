@@ -0,0 +1,23 @@
+"""audit log indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_audit_logs_timestamp", "audit_logs", ["timestamp"])
+    op.create_index("ix_audit_logs_user_id_id", "audit_logs", ["user_id", "id"])
+    op.create_index("ix_audit_logs_action_id", "audit_logs", ["action", "id"])
+
+def downgrade():
+    op.drop_index("ix_audit_logs_action_id", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_user_id_id", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_timestamp", table_name="audit_logs")
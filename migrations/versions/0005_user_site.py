@@ -0,0 +1,23 @@
+"""users.site
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("users", sa.Column("site", sa.String(), nullable=True))
+    op.create_index("ix_users_site", "users", ["site"])
+
+def downgrade():
+    op.drop_index("ix_users_site", table_name="users")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("site")
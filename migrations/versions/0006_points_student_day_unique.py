@@ -0,0 +1,35 @@
+"""unique points row per student and day
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# Later rows for the same student and day are duplicates left by concurrent
+# check-in flushes; each one also added its total to the student's.
+DUPLICATES = """
+    SELECT id FROM points p
+    WHERE student_id IS NOT NULL AND award_date IS NOT NULL
+      AND id > (SELECT MIN(id) FROM points q WHERE q.student_id = p.student_id AND q.award_date = p.award_date)
+"""
+
+def upgrade():
+    op.execute(f"""
+        UPDATE students SET total_points = COALESCE(total_points, 0) - (
+            SELECT COALESCE(SUM(total), 0) FROM points
+            WHERE points.student_id = students.id AND points.id IN ({DUPLICATES})
+        )
+        WHERE id IN (SELECT student_id FROM points WHERE id IN ({DUPLICATES}))
+    """)
+    op.execute(f"DELETE FROM points WHERE id IN ({DUPLICATES})")
+    op.create_index("uq_points_student_id_award_date", "points", ["student_id", "award_date"], unique=True)
+
+def downgrade():
+    op.drop_index("uq_points_student_id_award_date", table_name="points")
@@ -0,0 +1,126 @@
+"""Measure the per-row cost of the student list and present-students list.
+
+Usage:
+    python scripts/bench_serialization.py [--rows 2000] [--repeat 5]
+
+Seeds a throwaway SQLite database with --rows students, all present today,
+and serves both lists from a small FastAPI app in two ways:
+
+    orm         ORM objects validated through the response model (students),
+                or ORM objects with one points lookup per row (present list),
+                encoded by FastAPI's default JSON response
+    projection  plain SQL rows encoded with orjson, as the API serves them
+
+Each request goes through FastAPI's TestClient, so routing, dependency and
+serialization overhead are all included; the median of --repeat runs is
+reported.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def seed(rows: int):
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        today = date.today()
+        event = models.Event(name="Benchmark", start_date=today, end_date=today, status="active")
+        db.add(event)
+        db.flush()
+        student_ids = [str(uuid.uuid4()) for _ in range(rows)]
+        db.execute(models.Student.__table__.insert(), [{
+            "id": student_id, "name": f"Student {i:05d}", "age": 4 + i % 12, "gender": ("male", "female")[i % 2],
+            "group": "7-9", "parent_name": f"Parent {i:05d}", "parent_phone": f"9{i:08d}", "total_points": 45,
+        } for i, student_id in enumerate(student_ids)])
+        db.execute(models.Enrolment.__table__.insert(), [{"event_id": event.id, "student_id": s} for s in student_ids])
+        db.execute(models.Points.__table__.insert(), [{
+            "student_id": s, "event_id": event.id, "award_date": today, "presence": True, "book": True,
+            "categories": models.CATEGORY_BITS["presence"] | models.CATEGORY_BITS["book"], "total": 45,
+        } for s in student_ids])
+        db.commit()
+    finally:
+        db.close()
+
+def build_app(rows: int):
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.orm import Session
+
+    from app import crud, models, schemas
+    from app.dependencies import get_db
+    from app.responses import FastJSONResponse
+
+    bench = FastAPI()
+
+    @bench.get("/students/orm", response_model=List[schemas.StudentResponse])
+    def students_orm(db: Session = Depends(get_db)):
+        return db.query(models.Student).limit(rows).all()
+
+    @bench.get("/students/projection")
+    def students_projection(db: Session = Depends(get_db)):
+        return FastJSONResponse(crud.get_student_rows(db, limit=rows))
+
+    @bench.get("/present/orm")
+    def present_orm(db: Session = Depends(get_db)):
+        today = date.today()
+        present = db.query(models.Student).join(models.Points).filter(models.Points.award_date == today, models.Points.presence == True).all()
+        return {"present_students": [{
+            "id": s.id, "name": s.name, "age": s.age, "gender": s.gender, "class": s.group,
+            "points_today": db.query(models.Points.total).filter(models.Points.student_id == s.id, models.Points.award_date == today).scalar() or 0,
+        } for s in present]}
+
+    @bench.get("/present/projection")
+    def present_projection(db: Session = Depends(get_db)):
+        return FastJSONResponse(crud.get_students_present_today(db))
+
+    return bench
+
+def measure(client, path: str, repeat: int) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+    body = response.json()
+    count = len(body) if isinstance(body, list) else len(body["present_students"])
+    return statistics.median(samples), count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ebf-bench-") as directory:
+        os.environ.update(
+            DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            SHARED_STATE_DIR=os.path.join(directory, "state"),
+            READ_REPLICA_URL="",
+            LOG_LEVEL="WARNING",
+        )
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        sys.path.insert(0, ROOT)
+        from fastapi.testclient import TestClient
+
+        seed(args.rows)
+        client = TestClient(build_app(args.rows))
+        print(f"{'list':<10} {'mode':<12} {'rows':>6} {'ms/request':>11} {'us/row':>8}")
+        for name in ("students", "present"):
+            for mode in ("orm", "projection"):
+                client.get(f"/{name}/{mode}")
+                seconds, count = measure(client, f"/{name}/{mode}", args.repeat)
+                print(f"{name:<10} {mode:<12} {count:>6} {seconds * 1000:>11.1f} {seconds / max(count, 1) * 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Replay event-day traffic against the API and report per-route latency.
+
+Usage:
+    python scripts/loadtest.py run [--profile event-day] [--duration 60] [--output before.json]
+    python scripts/loadtest.py run --url http://127.0.0.1:8000 --username admin --password secret
+    python scripts/loadtest.py compare before.json after.json
+
+Without --url, a fresh SQLite database is migrated, `app.main:app` is served
+by uvicorn on --port, and an admin, teachers, an event covering today and
+--students students are created through the API before the run. Requires
+httpx (`pip install httpx`).
+
+A profile is a set of scenarios, each a number of virtual users looping over
+one kind of request during part of the run:
+
+    event-day   login storm at opening, check-in burst, dashboard polling
+                throughout, occasional point adjustments
+    checkin     check-in burst only
+    dashboard   dashboard polling only
+    login       login storm only
+
+Every route reports requests, throughput, p50/p95/p99/max latency and error
+rate (5xx and transport failures; 4xx are counted per status but not as
+errors). `compare` prints the change between two saved runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("loadtest needs httpx: pip install httpx")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEACHERS = 20
+PASSWORD = "loadtest-password"
+
+DASHBOARD_PATHS = [
+    "/stats/event/summary",
+    "/stats/today/summary",
+    "/stats/today/students",
+    "/stats/attendance/daily",
+    "/stats/points/distribution",
+    "/stats/performance/rankings",
+    "/stats/engagement",
+    "/stats/event/predictions",
+]
+
+class Context:
+    def __init__(self, token: str, student_ids: list, teachers: list):
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.student_ids = student_ids
+        self.teachers = teachers
+
+async def login(client, ctx):
+    username = random.choice(ctx.teachers)
+    response = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+    return "POST /auth/token", response
+
+async def checkin(client, ctx):
+    student_id = random.choice(ctx.student_ids)
+    points = {
+        "presence": True,
+        "book": random.random() < 0.7,
+        "versicle": random.random() < 0.5,
+        "participation": random.random() < 0.6,
+        "guest": random.random() < 0.05,
+        "game": random.random() < 0.3,
+    }
+    response = await client.post(f"/students/{student_id}/points", json={"points": points}, headers=ctx.headers)
+    return "POST /students/{id}/points", response
+
+async def dashboard(client, ctx):
+    path = random.choice(DASHBOARD_PATHS)
+    response = await client.get(path, headers=ctx.headers)
+    return f"GET {path}", response
+
+async def adjust(client, ctx):
+    student_id = random.choice(ctx.student_ids)
+    adjustment = {"amount": random.choice([-10, -5, 5, 10, 20]), "reason": "loadtest"}
+    response = await client.patch(f"/students/{student_id}/points/adjust", json=adjustment, headers=ctx.headers)
+    return "PATCH /students/{id}/points/adjust", response
+
+# scenario: (action, virtual users, pause between requests in seconds,
+#            start and end of its window as a share of the run)
+PROFILES = {
+    "event-day": [
+        (login, 20, 0, 0, 0.15),
+        (checkin, 10, 0, 0.1, 0.6),
+        (dashboard, 4, 1.0, 0, 1),
+        (adjust, 1, 2.0, 0, 1),
+    ],
+    "checkin": [(checkin, 20, 0, 0, 1)],
+    "dashboard": [(dashboard, 16, 0.5, 0, 1)],
+    "login": [(login, 40, 0, 0, 1)],
+}
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def add(self, route: str, seconds: float, status):
+        self.latencies.setdefault(route, []).append(seconds)
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def _summary(self, latencies: list, statuses: dict, elapsed: float) -> dict:
+        ordered = sorted(latencies)
+
+        def percentile(q):
+            return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+        errors = sum(n for status, n in statuses.items() if status == "error" or int(status) >= 500)
+        return {
+            "requests": len(ordered),
+            "throughput": round(len(ordered) / elapsed, 2),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(ordered[-1] * 1000, 1),
+            "errors": errors,
+            "error_rate": round(errors / len(ordered) * 100, 2),
+            "statuses": {str(status): n for status, n in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        }
+
+    def report(self, elapsed: float) -> dict:
+        routes = {route: self._summary(self.latencies[route], self.statuses[route], elapsed) for route in sorted(self.latencies)}
+        everything = [s for samples in self.latencies.values() for s in samples]
+        totals = {}
+        for counts in self.statuses.values():
+            for status, n in counts.items():
+                totals[status] = totals.get(status, 0) + n
+        return {"routes": routes, "total": self._summary(everything, totals, elapsed) if everything else {}}
+
+async def virtual_user(client, ctx, recorder: Recorder, action, pause: float, start: float, end: float):
+    now = time.perf_counter()
+    if start > now:
+        await asyncio.sleep(start - now)
+    while time.perf_counter() < end:
+        started = time.perf_counter()
+        try:
+            route, response = await action(client, ctx)
+            recorder.add(route, time.perf_counter() - started, response.status_code)
+        except httpx.HTTPError:
+            recorder.add(action.__name__, time.perf_counter() - started, "error")
+        if pause:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * pause)
+
+async def get_token(client, username: str, password: str) -> str:
+    response = await client.post("/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def seed(client, students: int) -> Context:
+    admin = f"loadtest-admin-{os.getpid()}"
+    await client.post("/users", json={"username": admin, "password": PASSWORD, "role": "admin"})
+    teachers = [f"loadtest-teacher-{i}" for i in range(TEACHERS)]
+    await asyncio.gather(*[client.post("/users", json={"username": t, "password": PASSWORD, "role": "teacher"}) for t in teachers])
+    ctx = Context(await get_token(client, admin, PASSWORD), [], teachers)
+
+    today = date.today()
+    await client.post("/events", json={"name": "Load test", "start_date": (today - timedelta(days=2)).isoformat(), "end_date": (today + timedelta(days=2)).isoformat()}, headers=ctx.headers)
+
+    semaphore = asyncio.Semaphore(20)
+
+    async def create(i):
+        async with semaphore:
+            response = await client.post("/students", json={
+                "name": f"Student {i:05d}", "age": 4 + i % 12, "gender": random.choice(["male", "female"]),
+            }, headers=ctx.headers)
+            response.raise_for_status()
+            ctx.student_ids.append(response.json()["id"])
+
+    await asyncio.gather(*[create(i) for i in range(students)])
+    return ctx
+
+async def existing_context(client, username: str, password: str) -> Context:
+    ctx = Context(await get_token(client, username, password), [], [username])
+    response = await client.get("/students", headers=ctx.headers)
+    response.raise_for_status()
+    ctx.student_ids = [s["id"] for s in response.json()]
+    if not ctx.student_ids:
+        sys.exit("the target has no students to award points to")
+    return ctx
+
+async def run_profile(url: str, profile: str, duration: float, students: int, username: str, password: str) -> dict:
+    limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+        if username:
+            ctx = await existing_context(client, username, password)
+        else:
+            ctx = await seed(client, students)
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        users = []
+        for action, count, pause, start, end in PROFILES[profile]:
+            for _ in range(count):
+                users.append(virtual_user(client, ctx, recorder, action, pause, started + start * duration, started + end * duration))
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - started
+
+    return {"profile": profile, "duration": round(elapsed, 1), "url": url, "started_at": time.time(), **recorder.report(elapsed)}
+
+def wait_for_server(url: str, server, timeout: float = 60.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            sys.exit("uvicorn exited before it started serving")
+        try:
+            httpx.get(f"{url}/health", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    sys.exit(f"no response from {url} within {timeout}s")
+
+def run(args):
+    if args.url:
+        return asyncio.run(run_profile(args.url, args.profile, args.duration, args.students, args.username, args.password))
+
+    with tempfile.TemporaryDirectory(prefix="ebf-loadtest-") as directory:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(directory, 'loadtest.db')}",
+                   SHARED_STATE_DIR=os.path.join(directory, "state"),
+                   READ_REPLICA_URL="",
+                   LOG_LEVEL="WARNING")
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_server(url, server)
+            return asyncio.run(run_profile(url, args.profile, args.duration, args.students, None, None))
+        finally:
+            server.terminate()
+            server.wait()
+
+def print_report(result: dict):
+    print(f"profile {result['profile']}, {result['duration']}s against {result['url']}")
+    print(f"{'route':<40} {'reqs':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>6}")
+    for route, s in list(result["routes"].items()) + [("total", result["total"])]:
+        if s:
+            print(f"{route:<40} {s['requests']:>7} {s['throughput']:>8.1f} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f} {s['error_rate']:>6.2f}")
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "     n/a"
+    return f"{(after - before) / before * 100:+7.1f}%"
+
+def compare(before: dict, after: dict):
+    print(f"{'route':<40} {'req/s':>17} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'err%':>13}")
+    routes = sorted(set(before["routes"]) | set(after["routes"]))
+    for route in routes + ["total"]:
+        b = before["total"] if route == "total" else before["routes"].get(route)
+        a = after["total"] if route == "total" else after["routes"].get(route)
+        if not a or not b:
+            print(f"{route:<40} only in {'after' if a else 'before'}")
+            continue
+        cells = [f"{a[key]:>8.1f} {_change(b[key], a[key])}" for key in ("throughput", "p50_ms", "p95_ms", "p99_ms")]
+        print(f"{route:<40} {' '.join(cells)} {b['error_rate']:>5.2f} -> {a['error_rate']:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a traffic profile")
+    run_parser.add_argument("--profile", choices=sorted(PROFILES), default="event-day")
+    run_parser.add_argument("--duration", type=float, default=60)
+    run_parser.add_argument("--students", type=int, default=500)
+    run_parser.add_argument("--url", help="target a running server instead of starting one")
+    run_parser.add_argument("--username", help="with --url: log in as this admin or teacher instead of seeding")
+    run_parser.add_argument("--password")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, help="random seed, for repeatable request mixes")
+    run_parser.add_argument("--output", help="write the results as JSON for `compare`")
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.before) as b, open(args.after) as a:
+            compare(json.load(b), json.load(a))
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    result = run(args)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
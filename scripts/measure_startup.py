@@ -0,0 +1,60 @@
+"""Measure import time of app.main and time-to-first-request.
+
+Usage:
+    python scripts/measure_startup.py [--runs 5] [--path /health] [--port 8765]
+
+Each run starts a fresh interpreter, so module caches do not hide the cost
+of connecting to the database or introspecting the schema at import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def measure_import() -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, stderr=subprocess.DEVNULL)
+    return float(output.decode().strip().splitlines()[-1])
+
+def measure_first_request(path: str, port: int, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    response.read()
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"no response from {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def summarize(label: str, samples: list):
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<24} median {statistics.median(ms):8.1f} ms   min {min(ms):8.1f} ms   max {max(ms):8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    summarize("import app.main", [measure_import() for _ in range(args.runs)])
+    summarize(f"first request {args.path}", [measure_first_request(args.path, args.port) for _ in range(args.runs)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+from app import schemas
+
+def test_student_name_with_ampersand_is_stored_as_typed():
+    student = schemas.StudentCreate(name="Tom & Jerry", age=8, gender="male")
+    assert student.name == "Tom & Jerry"
+
+def test_student_update_strips_disallowed_tags_without_escaping():
+    update = schemas.StudentUpdate(name="Ann <script>x</script>", notes="Fish & chips")
+    assert update.name == "Ann x"
+    assert update.notes == "Fish & chips"